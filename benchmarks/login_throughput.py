@@ -0,0 +1,57 @@
+"""Password checks (logins) per second for each hashing worker count.
+
+    python benchmarks/login_throughput.py --workers 1 2 4 8 --rounds 12
+
+Every run hammers flaskblog.passwords.check_password_hash from more client threads than there are workers, the way
+a threaded server would, and reports the sustained rate.
+"""
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import flaskblog  # noqa: E402
+from flaskblog.config import TestConfig  # noqa: E402
+
+
+def run(executor: str, workers: int, rounds: int, logins: int) -> float:
+    class BenchConfig(TestConfig):
+        BCRYPT_LOG_ROUNDS = rounds
+        HASHING_EXECUTOR = executor
+        HASHING_WORKERS = workers
+        HASHING_MAX_PENDING = 4 * workers
+        HASHING_QUEUE_TIMEOUT = 60.0
+
+    app = flaskblog.create_app(BenchConfig)
+    hasher = flaskblog.passwords
+    pw_hash = hasher.generate_password_hash("correct horse")  # also starts the pool
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2 * workers) as clients:
+        assert all(clients.map(lambda _: hasher.check_password_hash(
+            pw_hash, "correct horse"), range(logins)))
+    elapsed = time.perf_counter() - start
+    hasher.shutdown()
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--logins", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"bcrypt cost {args.rounds}, {args.executor} pool, {os.cpu_count()} CPUs")
+    for workers in args.workers:
+        rate = run(args.executor, workers, args.rounds, args.logins)
+        print(f"{workers:>3} workers: {rate:7.1f} logins/s")
+
+
+if __name__ == "__main__":
+    main()
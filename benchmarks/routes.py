@@ -0,0 +1,218 @@
+"""Latency percentiles and throughput of the hot routes at several dataset sizes, as JSON.
+
+    python benchmarks/routes.py --sizes 1000 100000 1000000 --output results.json
+
+For every size an app is built with create_app on a test config and a sqlite file seeded by `flask data seed`
+(deterministic, so runs are comparable). Seeding 1M posts takes a few minutes; --data-dir keeps the seeded databases
+for the next run. Each scenario is then timed through the test client: home at the first and a deep page (page
+numbers and cursors), single posts, user_posts, the Atom feeds, login and registration. The page cache is off
+unless --cache is given, so the numbers are about rendering the pages, not serving them from memory.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import flaskblog  # noqa: E402
+from flaskblog.config import TestConfig  # noqa: E402
+from flaskblog.models import Post, User  # noqa: E402
+from flaskblog.posts.utils import _encode_cursor  # noqa: E402
+
+PASSWORD = "benchmark password"
+
+
+def percentile(samples, p):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def make_app(db_path: str, args):
+    class BenchConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + db_path
+        CACHE_TYPE = "lru" if args.cache else "null"
+        BCRYPT_LOG_ROUNDS = args.rounds
+        HASHING_EXECUTOR = args.hashing_executor
+        POST_MARKUP = "plain"  # whatever POST_MARKUP the environment sets, runs stay comparable
+
+    return flaskblog.create_app(BenchConfig)
+
+
+def seeded_database(n_posts: int, args) -> Tuple[str, Optional[float]]:
+    """Path of a database with `n_posts` seeded posts, reused from --data-dir when it's there. Without --data-dir
+    it's in a new temporary directory, which the caller removes.
+    """
+    directory = args.data_dir or tempfile.mkdtemp()
+    os.makedirs(directory, exist_ok=True)
+    db_path = os.path.abspath(os.path.join(directory, f"bench-{n_posts}-r{args.rounds}.db"))
+    if os.path.exists(db_path):
+        return db_path, None
+
+    app = make_app(db_path + ".tmp", args)
+    with app.app_context():
+        flaskblog.db.create_all()
+    start = time.perf_counter()
+    result = app.test_cli_runner().invoke(args=[
+        "data", "seed", "--users", str(max(10, min(10_000, n_posts // 10))), "--posts", str(n_posts),
+        "--seed", "42", "--password", PASSWORD])
+    if result.exit_code != 0:
+        raise RuntimeError(result.output) from result.exception
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        flaskblog.db.engine.dispose()
+    shutil.move(db_path + ".tmp", db_path)  # only complete databases are reused
+    return db_path, elapsed
+
+
+def scenarios(app, n_posts: int, rng: random.Random) -> dict:
+    """Name -> (function making the request, expected status) for a database of `n_posts` posts."""
+    per_page = app.config["POSTS_PER_PAGE"]
+    with app.app_context():
+        session = flaskblog.db.session
+        post_ids = [post_id for post_id, in session.query(Post.id)]
+        usernames = [username for username, in session.query(User.username).order_by(User.id)]
+        emails = [email for email, in session.query(User.email).order_by(User.id)]
+        # the seeder gives the first users the most posts
+        top_author = usernames[0]
+        deep_page = max(1, int(n_posts * 0.9) // per_page)
+        anchor = Post.query.order_by(Post.date_posted.desc(), Post.id.desc()).offset(
+            deep_page * per_page - 1).first()
+        deep_cursor = _encode_cursor(anchor)
+    registrations = itertools.count()
+
+    def get(url):
+        return lambda client: client.get(url)
+
+    def login(client):
+        index = rng.randrange(len(emails))
+        return client.post("/login", data={"email": emails[index], "password": PASSWORD})
+
+    def register(client):
+        n = next(registrations)
+        return client.post("/register", data={
+            "username": f"bench{n}", "email": f"bench{n}@example.com",
+            "password": PASSWORD, "confirm_password": PASSWORD})
+
+    return {
+        "home_first": (get("/home"), 200),
+        "home_deep_offset": (get(f"/home?page={deep_page}"), 200),
+        "home_deep_cursor": (get(f"/home?after={deep_cursor}"), 200),
+        "post": (lambda client: client.get(f"/post/{rng.choice(post_ids)}"), 200),
+        "user_posts_top_author": (get(f"/user/{top_author}"), 200),
+        "user_posts_random": (lambda client: client.get(f"/user/{rng.choice(usernames)}"), 200),
+        "feed": (get("/feed.atom"), 200),
+        "user_feed_top_author": (get(f"/user/{top_author}/feed.atom"), 200),
+        "login": (login, 302),
+        "register": (register, 302),
+    }
+
+
+def measure(app, request, expected: int, n_requests: int, concurrency: int, warmup: int) -> dict:
+    def timed(_):
+        # a client per request: logins and registrations must not see the session of an earlier one
+        client = app.test_client()
+        start = time.perf_counter()
+        response = request(client)
+        elapsed = (time.perf_counter() - start) * 1000
+        assert response.status_code == expected, (response.status_code, response.data[:200])
+        return elapsed
+
+    for i in range(warmup):
+        timed(i)
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as clients:
+        samples = list(clients.map(timed, range(n_requests)))
+    wall = time.perf_counter() - start
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": percentile(samples, 0.50),
+        "p90_ms": percentile(samples, 0.90),
+        "p95_ms": percentile(samples, 0.95),
+        "p99_ms": percentile(samples, 0.99),
+        "max_ms": max(samples),
+        "throughput_rps": n_requests / wall,
+    }
+
+
+def environment(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100_000, 1_000_000])
+    parser.add_argument("--scenarios", nargs="+", default=None, help="Only run these scenarios.")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario.")
+    parser.add_argument("--auth-requests", type=int, default=20,
+                        help="Timed requests of login / register, which are bound by bcrypt.")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1, help="Client threads.")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost of the seeded and new passwords.")
+    parser.add_argument("--hashing-executor", choices=["process", "thread", "inline"], default="process")
+    parser.add_argument("--cache", action="store_true", help="Turn the rendered page cache on.")
+    parser.add_argument("--data-dir", default=None, help="Keep seeded databases here and reuse them.")
+    parser.add_argument("--output", default="-", help="JSON results file, - for stdout.")
+    args = parser.parse_args()
+
+    results = []
+    for n_posts in args.sizes:
+        db_path, seed_seconds = seeded_database(n_posts, args)
+        if seed_seconds is not None:
+            print(f"seeded {n_posts} posts in {seed_seconds:.1f}s", file=sys.stderr)
+        # registrations write to the database, so every run starts from a copy of the seeded one
+        run_dir = tempfile.mkdtemp()
+        run_path = os.path.join(run_dir, "run.db")
+        shutil.copy(db_path, run_path)
+        app = make_app(run_path, args)
+        for name, (request, expected) in scenarios(app, n_posts, random.Random(42)).items():
+            if args.scenarios and name not in args.scenarios:
+                continue
+            n_requests = args.auth_requests if name in ("login", "register") else args.requests
+            result = measure(app, request, expected, n_requests, args.concurrency, min(args.warmup, n_requests))
+            results.append({"posts": n_posts, "scenario": name, **result})
+            print(f"{n_posts:>8} {name:>22}: p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms"
+                  f"  p99 {result['p99_ms']:8.2f} ms  {result['throughput_rps']:8.1f} req/s", file=sys.stderr)
+        flaskblog.passwords.shutdown()
+        with app.app_context():
+            flaskblog.db.engine.dispose()
+        shutil.rmtree(run_dir)
+        if not args.data_dir:
+            shutil.rmtree(os.path.dirname(db_path))
+
+    report = json.dumps({"environment": environment(args), "results": results}, indent=2)
+    if args.output == "-":
+        print(report)
+    else:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Latency of full-text search over a synthetic blog.
+
+    python benchmarks/search_latency.py --posts 100000
+
+Seeds a throwaway sqlite database (the FTS index is filled by its triggers while seeding), then times the first and
+a deep page of /search for a few common and rare terms.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import flaskblog  # noqa: E402
+from flaskblog.config import TestConfig  # noqa: E402
+from flaskblog.models import Post, User  # noqa: E402
+
+WORDS = [f"word{i}" for i in range(5000)]
+
+
+def seed(n_posts: int, rng: random.Random):
+    flaskblog.db.session.execute(User.__table__.insert(), [
+        {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "password": "x"} for i in range(1, 101)
+    ])
+    batch = []
+    for i in range(1, n_posts + 1):
+        # zipf-ish word frequencies, so there are both very common and rare terms
+        words = [WORDS[min(int(rng.paretovariate(1.2)) - 1, len(WORDS) - 1)]
+                 for _ in range(rng.randint(20, 300))]
+        batch.append({"id": i, "title": " ".join(words[:6]), "content": " ".join(words),
+                      "user_id": rng.randint(1, 100)})
+        if len(batch) == 5000:
+            flaskblog.db.session.execute(Post.__table__.insert(), batch)
+            batch = []
+    if batch:
+        flaskblog.db.session.execute(Post.__table__.insert(), batch)
+    flaskblog.db.session.commit()
+
+
+def percentile(samples, p):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "search.db")
+
+    class BenchConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + db_path
+        CACHE_TYPE = "null"
+
+    app = flaskblog.create_app(BenchConfig)
+    client = app.test_client()
+    with app.app_context():
+        flaskblog.db.create_all()
+        start = time.perf_counter()
+        seed(args.posts, random.Random(42))
+        print(f"seeded {args.posts} posts in {time.perf_counter() - start:.1f}s")
+
+    for term in ["word0", "word1 word2", "word50", "word4000", "nomatch"]:
+        for label, pages in [("page 1", 0), ("page 10", 9)]:
+            samples = []
+            for _ in range(args.repeat):
+                url = f"/search?q={term}"
+                start = time.perf_counter()
+                for _ in range(pages + 1):
+                    response = client.get(url)
+                    cursor = response.data.decode().split("after=")
+                    url = f"/search?q={term}&after=" + cursor[1].split('"')[0] if len(cursor) > 1 else url
+                samples.append((time.perf_counter() - start) * 1000 / (pages + 1))
+            print(f"{term!r:>14} {label:>7}: p50 {statistics.median(samples):7.2f} ms"
+                  f"  p95 {percentile(samples, 0.95):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Cold start of a worker: import, create_app and first request, each in a fresh interpreter, as JSON.
+
+    python benchmarks/startup.py --runs 20 --output startup.json
+
+Also lists which of the lazily imported heavy modules (PIL, bcrypt, flask_mail ...) got loaded anyway by create_app
+and by the first request, so an eager import sneaking back in shows up. --warmup runs flaskblog.warmup in
+create_app, to see what it costs up front and saves on the first request.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY_MODULES = ["PIL.Image", "bcrypt", "flask_mail", "smtplib", "redis", "markdown", "bleach"]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import flaskblog
+from flaskblog.config import TestConfig
+imported = time.perf_counter()
+
+class StartupConfig(TestConfig):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///" + {db_path!r}
+    CACHE_TYPE = "null"
+    WARMUP = {warmup!r}
+
+app = flaskblog.create_app(StartupConfig)
+created = time.perf_counter()
+after_create = [m for m in {heavy!r} if m in sys.modules]
+response = app.test_client().get("/home")
+assert response.status_code == 200, response.status_code
+first_request = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (first_request - created) * 1000,
+    "total_ms": (first_request - start) * 1000,
+    "heavy_after_create_app": after_create,
+    "heavy_after_first_request": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+# the shipped database has the schema of the first version of the app, brought up to date once before the runs
+UPGRADE = """
+import flaskblog, flaskblog.schema
+from flaskblog.config import TestConfig
+
+class StartupConfig(TestConfig):
+    SQLALCHEMY_DATABASE_URI = "sqlite:///" + {db_path!r}
+
+with flaskblog.create_app(StartupConfig).app_context():
+    flaskblog.schema.upgrade()
+"""
+
+
+def percentile(samples, p):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--warmup", action="store_true", help="Set WARMUP in the config.")
+    parser.add_argument("--output", default="-", help="JSON results file, - for stdout.")
+    args = parser.parse_args()
+
+    # a copy, the shipped database must not be touched
+    db_path = os.path.join(tempfile.mkdtemp(), "site.db")
+    shutil.copy(os.path.join(ROOT, "flaskblog", "site.db"), db_path)
+    subprocess.run([sys.executable, "-c", UPGRADE.format(db_path=db_path)], cwd=ROOT, check=True)
+    code = CHILD.format(db_path=db_path, warmup=args.warmup, heavy=HEAVY_MODULES)
+
+    runs = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    summary = {}
+    for key in ["import_ms", "create_app_ms", "first_request_ms", "total_ms"]:
+        samples = [run[key] for run in runs]
+        summary[key] = {"p50": statistics.median(samples), "p95": percentile(samples, 0.95), "min": min(samples)}
+        print(f"{key:>17}: p50 {summary[key]['p50']:8.1f} ms  p95 {summary[key]['p95']:8.1f} ms", file=sys.stderr)
+    print(f"heavy modules after create_app: {runs[-1]['heavy_after_create_app']}, after the first request: "
+          f"{runs[-1]['heavy_after_first_request']}", file=sys.stderr)
+
+    report = json.dumps({
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "args": vars(args)},
+        "summary": summary,
+        "heavy_after_create_app": runs[-1]["heavy_after_create_app"],
+        "heavy_after_first_request": runs[-1]["heavy_after_first_request"],
+        "runs": runs,
+    }, indent=2)
+    if args.output == "-":
+        print(report)
+    else:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    shutil.rmtree(os.path.dirname(db_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,83 @@
+import os
 from flask import Flask
-from flaskblog.config import Config
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt  # Flask password encryption
+from flaskblog.config import configs
+from flaskblog.database import SQLAlchemy
 # We add some functionalities to our db models, and it will handle all the sessions in the background
 from flask_login import LoginManager
-import flask_mail
+from flaskblog.cache import ObjectCache, ResponseCache
+from flaskblog.hashing import PasswordHasher  # bcrypt password hashing, off the request threads
+from flaskblog.lazy import LazyExtension
 # we're going to need a mail server, mail port. TLS. username and password for that server.
 
 # extensions not bound to flask instance, will be bound with passed in config when run.py is executed 
 db = SQLAlchemy()
 
-bcrypt = Bcrypt()
+passwords = PasswordHasher()
 
 login_manager = LoginManager()
 # redirects to login page if user_authentication is required but not done.
 login_manager.login_view = "users.login"  # type: ignore
 login_manager.login_message_category = "info"
 
-mail = flask_mail.Mail()
 
+def _make_mail():
+    import flask_mail
+    return flask_mail.Mail()
 
-def create_app(config_cls=Config):
+
+# only the outbox worker sends mail, so flask_mail is imported on its first send rather than in every worker
+mail = LazyExtension(_make_mail)
+
+# rendered pages of public views, invalidated by the routes that write posts and users
+cache = ResponseCache()
+# snapshots of logged in users, so loading the session user doesn't hit the database on every request
+user_cache = ObjectCache("USER_CACHE")
+
+
+def create_app(config_cls=None):
     app = Flask(__name__)
-    app.config.from_object(config_cls)
+    # e.g. FLASKBLOG_CONFIG=production for the tuned database profile
+    app.config.from_object(
+        config_cls or configs[os.environ.get("FLASKBLOG_CONFIG", "default")])
+
+    from flaskblog.posts.rendering import _check_markup
+    _check_markup(app.config["POST_MARKUP"])
 
     db.init_app(app)
-    bcrypt.init_app(app)
+    passwords.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
+    cache.init_app(app)
+    user_cache.init_app(app)
+
+    from flaskblog import assets, compression, data, metrics, outbox, ratelimit, schema, sqlstats, streaming
+    assets.init_app(app)
+    streaming.init_app(app)
+    compression.init_app(app)
+    sqlstats.init_app(app)
+    metrics.init_app(app)
+    ratelimit.init_app(app)  # after metrics, so throttled requests are timed and counted too
+    outbox.init_app(app)
+    data.init_app(app)
+    schema.init_app(app)
 
     from flaskblog.main.routes import main
     from flaskblog.posts.routes import posts
     from flaskblog.users.routes import users
+    from flaskblog.search.routes import search
+    from flaskblog.api.routes import api
+    from flaskblog.feeds.routes import feeds
     from flaskblog.errors.handlers import errors
 
     app.register_blueprint(users)
     app.register_blueprint(posts)
     app.register_blueprint(main)
+    app.register_blueprint(search)
+    app.register_blueprint(api)
+    app.register_blueprint(feeds)
     app.register_blueprint(errors)
 
+    from flaskblog import warmup
+    warmup.init_app(app)  # last, once every blueprint (and template folder) is registered
+
     return app
@@ -0,0 +1,117 @@
+import flask
+from werkzeug.exceptions import HTTPException
+
+import flaskblog
+from flaskblog.api.utils import (POST_COLUMNS, USER_COLUMNS, _export_csv, _export_ndjson, _json_response,
+                                 _post_rows, _requested_fields, _requested_limit, _seek_paginate_by_id, _serialize,
+                                 _user_rows)
+from flaskblog.database import read_replica
+from flaskblog.models import Post, User
+from flaskblog.posts.utils import _seek_paginate
+from flaskblog.sqlstats import query_budget
+
+# bump the prefix (and keep the old blueprint around) for incompatible changes
+api = flask.Blueprint("api", __name__, url_prefix="/api/v1")
+
+EXPORT_FORMATS = {
+    "ndjson": (_export_ndjson, "application/x-ndjson"),
+    "csv": (_export_csv, "text/csv"),
+}
+
+
+@api.errorhandler(HTTPException)
+# the app wide handlers of these codes (errors blueprint) would otherwise win over HTTPException
+@api.errorhandler(403)
+@api.errorhandler(404)
+@api.errorhandler(500)
+def api_error(error: HTTPException):
+    # API clients get JSON errors instead of the HTML error pages
+    return _json_response({"error": error.name, "message": error.description}, error.code or 500)
+
+
+def _page_response(page, fields) -> flask.Response:
+    return _json_response({
+        "items": [_serialize(row, fields) for row in page.items],
+        "next": page.next_cursor,
+        "prev": page.prev_cursor,
+    })
+
+
+def _post_page(query, fields) -> flask.Response:
+    args = flask.request.args
+    return _page_response(
+        _seek_paginate(query, after=args.get("after"), before=args.get("before"), per_page=_requested_limit()), fields)
+
+
+@api.route("/posts")
+@read_replica
+@query_budget(2)  # one page of posts + session user
+def list_posts():
+    """Newest posts first. ?after= / ?before= take the "next" / "prev" cursors of a previous page."""
+    fields = _requested_fields(POST_COLUMNS)
+    return _post_page(_post_rows(fields), fields)
+
+
+@api.route("/posts/<int:post_id>")
+@read_replica
+@query_budget(2)
+def get_post(post_id: int):
+    fields = _requested_fields(POST_COLUMNS)
+    row = _post_rows(fields).filter(Post.id == post_id).first()
+    if row is None:
+        flask.abort(404)
+    return _json_response(_serialize(row, fields))
+
+
+@api.route("/users")
+@read_replica
+@query_budget(2)  # one page of users + session user
+def list_users():
+    """Users in sign-up (id) order. ?after= / ?before= take the "next" / "prev" cursors of a previous page."""
+    fields = _requested_fields(USER_COLUMNS)
+    args = flask.request.args
+    return _page_response(_seek_paginate_by_id(_user_rows(fields), User.id, after=args.get("after"),
+                                               before=args.get("before"), per_page=_requested_limit()), fields)
+
+
+@api.route("/users/<string:username>")
+@read_replica
+@query_budget(2)
+def get_user(username: str):
+    fields = _requested_fields(USER_COLUMNS)
+    row = flaskblog.db.session.query(*(USER_COLUMNS[field] for field in fields)).filter(
+        User.username == username).first()
+    if row is None:
+        flask.abort(404)
+    return _json_response(_serialize(row, fields))
+
+
+@api.route("/users/<string:username>/posts")
+@read_replica
+@query_budget(3)  # the user's id + one page of posts + session user
+def list_user_posts(username: str):
+    user_id = flaskblog.db.session.query(User.id).filter(
+        User.username == username).scalar()
+    if user_id is None:
+        flask.abort(404)
+    fields = _requested_fields(POST_COLUMNS)
+    return _post_page(_post_rows(fields).filter(Post.user_id == user_id), fields)
+
+
+@api.route("/posts/export")
+def export_posts():
+    """Every post as NDJSON (default) or CSV (?format=csv), streamed in API_EXPORT_BATCH_SIZE batches."""
+    export_format = flask.request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        flask.abort(400, description=f"Unknown format {export_format!r}, use one of: {', '.join(EXPORT_FORMATS)}")
+    fields = _requested_fields(POST_COLUMNS)
+    generate, mimetype = EXPORT_FORMATS[export_format]
+
+    def stream():
+        # runs after the view returned, so mark the replica as fine from in here
+        flask.g.read_replica = True
+        yield from generate(fields, flask.current_app.config["API_EXPORT_BATCH_SIZE"])
+
+    return flask.current_app.response_class(
+        flask.stream_with_context(stream()), mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=posts.{export_format}"})
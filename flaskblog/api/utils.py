@@ -0,0 +1,156 @@
+import base64
+import binascii
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Iterator, List, Optional, Sequence
+
+import flask
+
+import flaskblog
+from flaskblog.models import Post, User
+from flaskblog.posts.utils import SeekPage
+
+# fields a client can ask for with ?fields=, in the order they're serialized
+POST_COLUMNS = {
+    "id": Post.id,
+    "title": Post.title,
+    "content": Post.content,
+    "content_html": Post.content_html,
+    "excerpt": Post.excerpt,
+    "word_count": Post.word_count,
+    "date_posted": Post.date_posted,
+    "date_modified": Post.date_modified,
+    "user_id": Post.user_id,
+    "author": User.username.label("author"),
+}
+USER_COLUMNS = {
+    "id": User.id,
+    "username": User.username,
+    "image_file": User.image_file,
+    "post_count": User.post_count,
+}
+
+
+def _requested_fields(columns: dict) -> List[str]:
+    """Fields named in ?fields=a,b,c (all of `columns` without it). Aborts with 400 on an unknown field."""
+    fields = flask.request.args.get("fields")
+    if not fields:
+        return list(columns)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in columns]
+    if unknown:
+        flask.abort(400, description=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+def _requested_limit() -> int:
+    config = flask.current_app.config
+    limit = flask.request.args.get("limit", config["API_PAGE_SIZE"], type=int)
+    return max(1, min(limit, config["API_MAX_PAGE_SIZE"]))
+
+
+def _post_rows(fields: Sequence[str]):
+    """Query of plain rows with only the requested post columns, so e.g. listing titles never reads `content`.
+    id and date_posted are always selected, pagination seeks on them.
+    """
+    columns = [Post.id, Post.date_posted] + [POST_COLUMNS[field] for field in fields
+                                             if field not in ("id", "date_posted")]
+    query = flaskblog.db.session.query(*columns)
+    if "author" in fields:
+        query = query.join(User, Post.user_id == User.id)
+    return query
+
+
+def _user_rows(fields: Sequence[str]):
+    """Query of plain rows with only the requested user columns. id is always selected, pagination seeks on it."""
+    return flaskblog.db.session.query(User.id, *(USER_COLUMNS[field] for field in fields if field != "id"))
+
+
+def _encode_id_cursor(row_id: int) -> str:
+    return base64.urlsafe_b64encode(str(row_id).encode("ascii")).decode("ascii").rstrip("=")
+
+
+def _decode_id_cursor(cursor: str) -> int:
+    """Inverse of _encode_id_cursor. Aborts with 400 on a tampered or truncated cursor."""
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii"))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        flask.abort(400)
+
+
+def _seek_paginate_by_id(query, column, after: Optional[str] = None, before: Optional[str] = None,
+                         per_page: int = 20) -> SeekPage:
+    """Pages through `query` in ascending `column` (a primary key) order, like posts.utils._seek_paginate does on
+    (date_posted, id): the page starts at the cursor's row in the index, and one extra row tells whether there is
+    more without a COUNT(*).
+    """
+    if before:
+        # walk the index downwards from the cursor, then flip the page back to ascending
+        rows = query.filter(column < _decode_id_cursor(before)).order_by(column.desc()).limit(per_page + 1).all()
+        items = rows[:per_page][::-1]
+        has_prev, has_next = len(rows) > per_page, True
+    else:
+        if after:
+            query = query.filter(column > _decode_id_cursor(after))
+        rows = query.order_by(column.asc()).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_prev, has_next = after is not None, len(rows) > per_page
+    return SeekPage(
+        items,
+        next_cursor=_encode_id_cursor(items[-1].id) if items and has_next else None,
+        prev_cursor=_encode_id_cursor(items[0].id) if items and has_prev else None,
+    )
+
+
+def _jsonable(value: Any) -> Any:
+    # stored datetimes are naive UTC
+    return value.isoformat() + "Z" if isinstance(value, datetime) else value
+
+
+def _serialize(row, fields: Sequence[str]) -> dict:
+    mapping = row._mapping
+    return {field: _jsonable(mapping[field]) for field in fields}
+
+
+def _json_response(data: Any, status: int = 200) -> flask.Response:
+    # compact separators whatever JSONIFY_PRETTYPRINT_REGULAR / debug say, integrations don't read it by eye
+    return flask.current_app.response_class(
+        json.dumps(data, separators=(",", ":"), ensure_ascii=False), status=status, mimetype="application/json")
+
+
+def _export_batches(fields: Sequence[str], batch_size: int) -> Iterator[list]:
+    """Walks the post table in id order, `batch_size` rows per query, seeking past the last id of the previous batch.
+    Only one batch is in memory at a time, however many posts there are.
+    """
+    last_id = 0
+    while True:
+        batch = _post_rows(fields).filter(Post.id > last_id).order_by(
+            Post.id).limit(batch_size).all()
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+        # the session keeps nothing from column queries, but drop the transaction so a long export doesn't pin
+        # an old snapshot of the database (and, in WAL mode, keep the WAL from being checkpointed)
+        flaskblog.db.session.rollback()
+
+
+def _export_ndjson(fields: Sequence[str], batch_size: int) -> Iterator[str]:
+    for batch in _export_batches(fields, batch_size):
+        yield "".join(json.dumps(_serialize(row, fields), separators=(",", ":"), ensure_ascii=False) + "\n"
+                      for row in batch)
+
+
+def _export_csv(fields: Sequence[str], batch_size: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in _export_batches(fields, batch_size):
+        writer.writerows([_jsonable(row._mapping[field]) for field in fields] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # no posts at all, still send the header
+        yield buffer.getvalue()
@@ -0,0 +1,262 @@
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from typing import Dict, Iterator, Optional
+
+import click
+import flask
+import flask.cli
+
+from flaskblog.users.avatars import DEFAULT_AVATAR
+
+# third party files the layout loads from the CDN, or from static/vendor once `flask assets vendor` fetched them
+# and ASSETS_VENDORED is on. The integrity hashes are checked on download and by the browser either way.
+VENDOR_ASSETS = {
+    "bootstrap.min.css": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css",
+        "sha384-1BmE4kWBq78iYhFldvKuhfTAU6auU8tT94WrHftjDbrCEXSU1oBoqyl2QvZ6jIW3",
+    ),
+    "bootstrap.bundle.min.js": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js",
+        "sha384-ka7Sk0Gln4gmtz2MlQnikT1wXgYsOg+OMhuP+IlRH9sENBO0LRn5q+8nbTov4+1p",
+    ),
+}
+VENDOR_DIR = "vendor"
+
+# only text compresses, images and fonts are compressed already
+COMPRESSIBLE = {".css", ".js", ".map", ".svg", ".json", ".txt", ".xml", ".html"}
+# precompressed variants, in order of preference when the client accepts several
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+IMMUTABLE = "public, max-age={max_age}, immutable"
+
+
+def _fingerprinted(path: str, data: bytes) -> str:
+    """main.css -> main.<first 12 hex of the sha256 of its content>.css, so a changed file gets a new URL."""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _sources(static_folder: str, dist_dir: str) -> Iterator[str]:
+    """Paths (relative to the static folder, with forward slashes) of the files to build. Uploaded avatars are
+    left out, their names are content hashes (or random) already and they come and go at runtime.
+    """
+    for directory, subdirectories, files in os.walk(static_folder):
+        relative = os.path.relpath(directory, static_folder).replace(os.sep, "/")
+        if relative == ".":
+            subdirectories[:] = [name for name in subdirectories if name != dist_dir]
+        for name in sorted(files):
+            path = name if relative == "." else f"{relative}/{name}"
+            if path.startswith("profile_pics/") and name != DEFAULT_AVATAR:
+                continue
+            yield path
+        subdirectories.sort()
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)  # mtime=0: the same input builds the same file
+    import brotli  # optional dependency, without it only gzip variants are built
+    return brotli.compress(data, quality=11)
+
+
+def _brotli_available() -> bool:
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(app: flask.Flask, clean: bool = False) -> Dict[str, str]:
+    """Copies every static file to ASSETS_DIST_DIR under a content-hashed name, next to .gz (and, with the brotli
+    package, .br) variants of the text ones, and writes the manifest that `url_for("static", ...)` goes through.
+
+    Files of earlier builds are kept unless `clean`, pages rendered (and cached) before a deploy may still
+    reference them.
+
+    Returns:
+        dict: the manifest, source path -> fingerprinted path.
+    """
+    static_folder = app.static_folder
+    dist_dir = app.config["ASSETS_DIST_DIR"]
+    encodings = [(encoding, suffix) for encoding, suffix in ENCODINGS
+                 if encoding != "br" or _brotli_available()]
+    manifest = {}
+    written = set()
+    for path in _sources(static_folder, dist_dir):
+        with open(os.path.join(static_folder, path), "rb") as file:
+            data = file.read()
+        target = f"{dist_dir}/{_fingerprinted(path, data)}"
+        manifest[path] = target
+        written.add(target)
+        target_path = os.path.join(static_folder, target)
+        if not os.path.exists(target_path):  # same name, same content
+            _write(target_path, data)
+        if os.path.splitext(path)[1] not in COMPRESSIBLE:
+            continue
+        for encoding, suffix in encodings:
+            written.add(target + suffix)
+            if not os.path.exists(target_path + suffix):
+                compressed = _compress(data, encoding)
+                if len(compressed) < len(data):
+                    _write(target_path + suffix, compressed)
+
+    manifest_path = os.path.join(static_folder, dist_dir, "manifest.json")
+    _write(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode() + b"\n")
+    written.add(f"{dist_dir}/manifest.json")
+
+    if clean:
+        for directory, _, files in os.walk(os.path.join(static_folder, dist_dir)):
+            for name in files:
+                path = os.path.relpath(os.path.join(directory, name), static_folder).replace(os.sep, "/")
+                if path not in written:
+                    os.remove(os.path.join(directory, name))
+    return manifest
+
+
+def _integrity(data: bytes, integrity: str) -> bool:
+    algorithm, _, expected = integrity.partition("-")
+    return base64.b64encode(hashlib.new(algorithm, data).digest()).decode() == expected
+
+
+def vendor(app: flask.Flask, base_url: Optional[str] = None) -> Dict[str, str]:
+    """Downloads VENDOR_ASSETS into static/vendor, checking each one against its integrity hash.
+
+    Args:
+        base_url: fetch the files from here (e.g. an internal mirror) rather than the CDN.
+
+    Returns:
+        dict: file name -> path it was written to.
+    """
+    import urllib.request  # pulls in ssl and http.client, only this command needs them
+    written = {}
+    for name, (url, integrity) in VENDOR_ASSETS.items():
+        if base_url:
+            url = f"{base_url.rstrip('/')}/{name}"
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = response.read()
+        if not _integrity(data, integrity):
+            raise ValueError(f"{url} doesn't match its integrity hash {integrity}")
+        path = os.path.join(app.static_folder, VENDOR_DIR, name)
+        _write(path, data)
+        written[name] = path
+    return written
+
+
+def vendor_asset(name: str) -> dict:
+    """URL and integrity hash of a VENDOR_ASSETS file for the templates: the local copy with ASSETS_VENDORED,
+    the CDN otherwise.
+    """
+    url, integrity = VENDOR_ASSETS[name]
+    if flask.current_app.config["ASSETS_VENDORED"]:
+        url = flask.url_for("static", filename=f"{VENDOR_DIR}/{name}")
+    return {"url": url, "integrity": integrity}
+
+
+def _fingerprint_url(endpoint: str, values: dict):
+    # url_for("static", filename="main.css") -> /static/dist/main.<hash>.css once the assets are built
+    if endpoint == "static" and "filename" in values:
+        fingerprinted = flask.current_app.extensions["assets"].get(values["filename"])
+        if fingerprinted is not None:
+            values["filename"] = fingerprinted
+
+
+def _immutable(filename: str) -> bool:
+    """Whether the file under this name never changes: built assets, and avatars, whose names are content hashes
+    (or random ones from before the avatar pipeline) that are never reused. default.jpg is the exception.
+    """
+    config = flask.current_app.config
+    if filename.startswith(config["ASSETS_DIST_DIR"] + "/"):
+        return not filename.endswith("/manifest.json")
+    return filename.startswith("profile_pics/") and not filename.endswith("/" + DEFAULT_AVATAR)
+
+
+def send_static_file(filename: str) -> flask.Response:
+    """The `static` view. Serves a precompressed variant of built assets when the client accepts it, and marks
+    files that never change as cacheable for ASSETS_MAX_AGE.
+    """
+    app = flask.current_app
+    if not _immutable(filename):
+        return app.send_static_file(filename)
+
+    max_age = app.config["ASSETS_MAX_AGE"]
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response = None
+    encoding = None
+    if os.path.splitext(filename)[1] in COMPRESSIBLE:
+        accepted = flask.request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if accepted[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                response = flask.send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype,
+                                                     max_age=max_age)
+                response.headers["Content-Encoding"] = encoding
+                break
+        response = response or flask.send_from_directory(app.static_folder, filename, mimetype=mimetype,
+                                                         max_age=max_age)
+        response.vary.add("Accept-Encoding")
+    else:
+        response = flask.send_from_directory(app.static_folder, filename, mimetype=mimetype, max_age=max_age)
+    response.headers["Cache-Control"] = IMMUTABLE.format(max_age=max_age)
+    return response
+
+
+def _load_manifest(app: flask.Flask) -> Dict[str, str]:
+    path = os.path.join(app.static_folder, app.config["ASSETS_DIST_DIR"], "manifest.json")
+    if not app.config["ASSETS_FINGERPRINT"] or not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def init_app(app: flask.Flask):
+    app.config.setdefault("ASSETS_FINGERPRINT", True)
+    app.config.setdefault("ASSETS_DIST_DIR", "dist")
+    app.config.setdefault("ASSETS_MAX_AGE", 365 * 24 * 3600)
+    app.config.setdefault("ASSETS_VENDORED", False)
+    # read once, a new build is picked up by the next start of the app
+    app.extensions["assets"] = _load_manifest(app)
+    app.url_defaults(_fingerprint_url)
+    app.view_functions["static"] = send_static_file
+    app.jinja_env.globals["vendor_asset"] = vendor_asset
+    app.cli.add_command(assets_cli)
+
+
+assets_cli = flask.cli.AppGroup("assets", help="Fingerprinted, precompressed static files.")
+
+
+@assets_cli.command("build")
+@click.option("--clean", is_flag=True, help="Delete the files of earlier builds.")
+def build_command(clean: bool):
+    """Fingerprint and precompress the static files, restart the app to serve them."""
+    app = flask.current_app._get_current_object()  # type: ignore
+    if not _brotli_available():
+        click.echo("brotli isn't installed, only building gzip variants.")
+    manifest = build(app, clean=clean)
+    for path, fingerprinted in sorted(manifest.items()):
+        click.echo(f"{path} -> {fingerprinted}")
+    click.echo(f"Built {len(manifest)} assets.")
+
+
+@assets_cli.command("vendor")
+@click.option("--base-url", default=None, help="Download from this mirror instead of the CDN.")
+def vendor_command(base_url: Optional[str]):
+    """Download the CDN dependencies into static/vendor, set ASSETS_VENDORED to use them."""
+    try:
+        written = vendor(flask.current_app._get_current_object(), base_url)  # type: ignore
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+    for name, path in written.items():
+        click.echo(f"{name} -> {path}")
+    click.echo("Run `flask assets build` to fingerprint them too.")
@@ -0,0 +1,270 @@
+import collections
+import functools
+import pickle
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+import flask
+import flask_login
+
+
+class LRUBackend:
+    """In-process cache backend. Keeps the `maxsize` most recently used entries, each optionally expiring after
+    `ttl` seconds. Counters (used as invalidation generations) live apart from the entries so they're never evicted.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = ttl if ttl is not None else self.ttl
+        with self._lock:
+            self._entries[key] = (
+                value, time.monotonic() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LocalSharedClient:
+    """Local stand-in for a shared key-value server. Implements the small part of the redis-py client API that
+    SharedBackend uses, so the shared code path can run in development and tests without a server.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value, expires = self._data.get(key, (None, None))
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._data.get(key, (0, None))[0]) + 1
+            self._data[key] = (str(value).encode("ascii"), None)
+            return value
+
+
+class SharedBackend:
+    """Cache backend on a shared key-value server (anything speaking the redis-py client API), so every app process
+    sees the same entries and the same invalidations. Values are pickled: the server must be trusted infrastructure.
+    """
+
+    def __init__(self, client, prefix: str = "flaskblog:", ttl: Optional[int] = None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key: str) -> Any:
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        ttl = ttl if ttl is not None else self.ttl
+        self.client.set(self.prefix + key, pickle.dumps(value),
+                        ex=int(ttl) if ttl else None)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def counter(self, key: str) -> int:
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+
+def _make_backend(cache_type: str, maxsize: int, ttl: Optional[float], shared_url: Optional[str]):
+    if cache_type == "lru":
+        return LRUBackend(maxsize=maxsize, ttl=ttl)
+    if cache_type == "shared":
+        if shared_url is None or shared_url.startswith("local://"):
+            client = LocalSharedClient()
+        else:
+            import redis  # optional dependency, only needed for a real shared cache
+            client = redis.Redis.from_url(shared_url)
+        return SharedBackend(client, ttl=int(ttl) if ttl else None)
+    if cache_type == "null":
+        return None
+    raise ValueError(f"Unknown cache type {cache_type!r}")
+
+
+class ObjectCache:
+    """Small cache of plain values (e.g. snapshots of rows) on the same backends as ResponseCache, configured by
+    `<prefix>_TYPE`, `<prefix>_MAXSIZE` and `<prefix>_TTL`. A "shared" cache uses the server at CACHE_SHARED_URL.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.backend = None
+
+    def init_app(self, app: flask.Flask):
+        app.config.setdefault(f"{self.prefix}_TYPE", "lru")
+        app.config.setdefault(f"{self.prefix}_MAXSIZE", 1024)
+        app.config.setdefault(f"{self.prefix}_TTL", 60)
+        app.config.setdefault("CACHE_SHARED_URL", None)
+        self.backend = _make_backend(app.config[f"{self.prefix}_TYPE"], app.config[f"{self.prefix}_MAXSIZE"],
+                                     app.config[f"{self.prefix}_TTL"], app.config["CACHE_SHARED_URL"])
+
+    def get(self, key: str) -> Any:
+        return self.backend.get(key) if self.backend is not None else None
+
+    def set(self, key: str, value: Any):
+        if self.backend is not None:
+            self.backend.set(key, value)
+
+    def delete(self, key: str):
+        if self.backend is not None:
+            self.backend.delete(key)
+
+
+class ResponseCache:
+    """Caches rendered pages of public views for anonymous visitors.
+
+    Every cached view declares tags (e.g. "feed", "post:<id>", "user:<username>") for the data it renders. Each tag
+    has a generation counter that is part of the cache key, so writes invalidate by bumping the generation of the
+    tags they touch instead of hunting down keys; stale entries are simply never looked up again and age out.
+    """
+
+    def __init__(self, app: Optional[flask.Flask] = None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: flask.Flask):
+        app.config.setdefault("CACHE_TYPE", "lru")
+        app.config.setdefault("CACHE_MAXSIZE", 512)
+        app.config.setdefault("CACHE_TTL", 300)
+        app.config.setdefault("CACHE_SHARED_URL", None)
+        self.backend = _make_backend(app.config["CACHE_TYPE"], app.config["CACHE_MAXSIZE"],
+                                     app.config["CACHE_TTL"], app.config["CACHE_SHARED_URL"])
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def invalidate(self, *tags: str):
+        """Drops every cached page rendered from data with any of `tags`. Call it after the write is committed."""
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.incr(f"gen:{tag}")
+
+    def _key(self, tags: Iterable[str]) -> str:
+        request = flask.request
+        # page / cursor params are all in the query string. Only anonymous requests get here, but keep the state in
+        # the key so a cached anonymous page can never be confused with anything else.
+        generations = ",".join(
+            f"{tag}={self.backend.counter(f'gen:{tag}')}" for tag in tags)
+        return f"view:{request.endpoint}:{request.full_path}:anon:{generations}"
+
+    def _cacheable(self) -> bool:
+        return (self.backend is not None and flask.request.method in ("GET", "HEAD")
+                and not flask_login.current_user.is_authenticated  # type: ignore
+                # pending flash messages are rendered into the page
+                and "_flashes" not in flask.session)
+
+    def _record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _store_when_sent(self, key: str, chunks: Iterable[bytes], headers: list) -> Iterator[bytes]:
+        body = []
+        for chunk in chunks:
+            body.append(chunk)
+            yield chunk
+        # not reached when the client goes away halfway, a partial page is never stored
+        self.backend.set(key, (b"".join(body), 200, headers))
+
+    def cached(self, tags: Callable[..., List[str]]) -> Callable:
+        """Serves a view from the cache for anonymous visitors.
+
+        Args:
+            tags (callable): gets the view's arguments, returns the tags of the data the page is rendered from.
+        """
+        def decorator(view: Callable) -> Callable:
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable():
+                    return view(*args, **kwargs)
+
+                key = self._key(tags(*args, **kwargs))
+                entry = self.backend.get(key)
+                self._record(hit=entry is not None)
+                if entry is not None:
+                    body, status, headers = entry
+                    response = flask.current_app.response_class(
+                        body, status=status, headers=headers)
+                    response.headers["X-Cache"] = "HIT"
+                    # the stored ETag / Last-Modified can answer a conditional GET right away
+                    return response.make_conditional(flask.request)
+
+                response = flask.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and response.is_streamed:
+                    # a streamed page (flaskblog.streaming) is stored once all of it has been sent
+                    response.response = self._store_when_sent(key, response.iter_encoded(),
+                                                              list(response.headers.items()))
+                elif response.status_code == 200:
+                    self.backend.set(key, (response.get_data(), response.status_code,
+                                           list(response.headers.items())))
+                response.headers["X-Cache"] = "MISS"
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,82 @@
+import gzip
+import zlib
+from typing import Iterable, Iterator
+
+import flask
+
+# appended to the strong ETag of a compressed response, the compressed bytes are another representation
+ETAG_SUFFIX = "-gzip"
+
+
+def _gzip_stream(chunks: Iterable[bytes], level: int) -> Iterator[bytes]:
+    """Compresses a streamed body chunk by chunk, flushing after each one so the client gets them as they come."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 16 + 15: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _strip_etag_suffix():
+    # clients revalidate with the ETag of the compressed response, the views and the page cache compare against
+    # the one they computed, so take the suffix off before either of them parses If-None-Match
+    environ = flask.request.environ
+    if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+    if if_none_match and ETAG_SUFFIX in if_none_match:
+        environ["HTTP_IF_NONE_MATCH"] = if_none_match.replace(ETAG_SUFFIX + '"', '"')
+
+
+def _suffix_etag(response: flask.Response):
+    etag, weak = response.get_etag()
+    if etag and not weak and not etag.endswith(ETAG_SUFFIX):
+        response.set_etag(etag + ETAG_SUFFIX)
+
+
+def _compress(response: flask.Response) -> flask.Response:
+    """Gzips responses of COMPRESS_MIMETYPES of at least COMPRESS_MIN_SIZE bytes (streamed ones whatever their
+    size) for clients that accept it.
+
+    Files sent by the static view are left alone, built assets have precompressed variants (flaskblog.assets).
+    """
+    config = flask.current_app.config
+    request = flask.request
+    if response.mimetype not in config["COMPRESS_MIMETYPES"] or "Content-Encoding" in response.headers:
+        return response
+    response.vary.add("Accept-Encoding")
+    if not request.accept_encodings["gzip"] or request.method == "HEAD" \
+            or "no-transform" in response.headers.get("Cache-Control", ""):
+        return response
+    if response.status_code == 304:
+        # what the client holds is the compressed representation, with the suffixed ETag
+        _suffix_etag(response)
+        return response
+    if response.status_code < 200 or response.status_code == 204 or response.direct_passthrough:
+        return response
+
+    level = config["COMPRESS_LEVEL"]
+    if response.is_streamed:
+        response.response = _gzip_stream(response.iter_encoded(), level)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < config["COMPRESS_MIN_SIZE"]:  # the gzip framing and a round trip of CPU aren't worth it
+            return response
+        response.set_data(gzip.compress(body, compresslevel=level, mtime=0))
+    response.headers["Content-Encoding"] = "gzip"
+    _suffix_etag(response)
+    return response
+
+
+def init_app(app: flask.Flask):
+    app.config.setdefault("COMPRESS_ENABLED", False)
+    app.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+    app.config.setdefault("COMPRESS_LEVEL", 6)
+    app.config.setdefault("COMPRESS_MIMETYPES", ("text/html", "text/css", "text/plain", "text/csv", "text/xml",
+                                                 "application/json", "application/x-ndjson",
+                                                 "application/javascript", "application/atom+xml",
+                                                 "application/rss+xml"))
+    if not app.config["COMPRESS_ENABLED"]:
+        return
+    app.before_request(_strip_etag_suffix)
+    app.after_request(_compress)
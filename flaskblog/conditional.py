@@ -0,0 +1,62 @@
+import functools
+import hashlib
+from datetime import datetime, timezone
+from typing import Callable, Optional, Sequence, Tuple
+
+import flask
+import flask_login
+
+
+def _make_etag(parts: Sequence) -> str:
+    return hashlib.sha1(repr(tuple(parts)).encode("utf-8")).hexdigest()
+
+
+def _is_not_modified(etag: str, last_modified: Optional[datetime]) -> bool:
+    request = flask.request
+    # If-None-Match wins over If-Modified-Since when a client sends both (RFC 7232 section 6)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        # HTTP dates have a resolution of one second
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional(validators: Callable[..., Optional[Tuple[Sequence, Optional[datetime]]]]) -> Callable:
+    """Answers conditional GETs (If-None-Match / If-Modified-Since) of a view with 304 Not Modified, without running
+    the view, and stamps full responses with a strong ETag and Last-Modified.
+
+    Args:
+        validators (callable): gets the view's arguments, returns the parts the ETag is computed from and the
+            last-modified time (naive UTC) of the page. It should only run a cheap metadata query. Returning None
+            (e.g. for a missing resource) leaves the request to the view.
+    """
+    def decorator(view: Callable) -> Callable:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # pending flash messages are rendered into the page, so the client's copy doesn't have them
+            if flask.request.method not in ("GET", "HEAD") or "_flashes" in flask.session:
+                return view(*args, **kwargs)
+
+            found = validators(*args, **kwargs)
+            if found is None:
+                return view(*args, **kwargs)
+            parts, last_modified = found
+            if last_modified is not None:
+                last_modified = last_modified.replace(tzinfo=timezone.utc)
+            # navbar and edit buttons depend on who is looking at the page
+            etag = _make_etag((flask.request.endpoint, flask_login.current_user.get_id(),  # type: ignore
+                               *parts))
+
+            if _is_not_modified(etag, last_modified):
+                response = flask.current_app.response_class(status=304)
+            else:
+                response = flask.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
@@ -1,3 +1,4 @@
+import json
 import os
 
 
@@ -8,11 +9,176 @@ class Config:
 
     # config for SQLAlchemy
     # /// means relative from current file.
-    SQLALCHEMY_DATABASE_URI = "sqlite:///site.db"
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///site.db")
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # run on every new sqlite connection, see flaskblog.database
+    SQLITE_PRAGMAS = {}
+
+    # config for post listings (home feed, user posts)
+    POSTS_PER_PAGE = 5
+    # "cursor" seeks on (date_posted, id) so a deep page costs the same as the first one,
+    # "offset" is the old page-number mode. A ?page= query param always falls back to "offset".
+    POSTS_PAGINATION = "cursor"
+    # characters of a post shown in listings, stored with the post. Run `flask posts rerender --all`
+    # after changing it.
+    POST_EXCERPT_LENGTH = 300
+    # "plain" or "markdown" (sanitized, needs the markdown and bleach packages), rendered to HTML when a post is
+    # written and stored with it. Posts rendered by another renderer or version are brought up to date by
+    # `flask posts rerender`.
+    POST_MARKUP = os.environ.get("POST_MARKUP", "plain")
+
+    # config for instrumentation (flaskblog.metrics, flaskblog.sqlstats)
+    METRICS_ENABLED = True  # records request / template / SQL / hashing timings and serves them on METRICS_PATH
+    METRICS_PATH = "/metrics"
+    SERVER_TIMING = os.environ.get("SERVER_TIMING", "").lower() in ("1", "true", "on")  # Server-Timing header
+    SLOW_REQUEST_THRESHOLD = 1.0  # seconds, slower requests are logged with a breakdown of their time
+    SQL_SLOW_QUERY_THRESHOLD = 0.1  # seconds, slower statements are logged
+
+    # config for worker startup (flaskblog.warmup). Heavy modules (PIL, bcrypt, flask_mail) are imported on first
+    # use, WARMUP does the first-request work in create_app instead, e.g. for a worker that serves everything.
+    WARMUP = os.environ.get("WARMUP", "").lower() in ("1", "true", "on")
+    WARMUP_DB_CONNECTIONS = 4  # pooled connections to open, at most the pool size
+    WARMUP_IMPORTS = ()  # e.g. ("PIL.Image", "bcrypt", "flask_mail")
+
+    # config for large pages. Views using flaskblog.streaming.render_template stream their page when their endpoint
+    # is listed here, e.g. ("main.home", "users.user_posts"). Responses are sent once the view returned otherwise.
+    STREAMING_VIEWS = ()
+    STREAMING_BUFFER = 8  # template output chunks per write to the client
+    # gzip text responses (flaskblog.compression), unless a proxy in front of the app already does
+    COMPRESS_ENABLED = os.environ.get("COMPRESS_ENABLED", "").lower() in ("1", "true", "on")
+    COMPRESS_MIN_SIZE = 1024  # bytes, smaller bodies are sent as they are. Streamed ones are always compressed.
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIMETYPES = ("text/html", "text/css", "text/plain", "text/csv", "text/xml", "application/json",
+                          "application/x-ndjson", "application/javascript", "application/atom+xml",
+                          "application/rss+xml")
+
+    # config for the JSON API (flaskblog.api)
+    API_PAGE_SIZE = 20  # default ?limit=
+    API_MAX_PAGE_SIZE = 100
+    API_EXPORT_BATCH_SIZE = 1000  # rows fetched per query while streaming an export
+
+    # config for the Atom / RSS feeds (flaskblog.feeds)
+    FEED_TITLE = "Flask Blog"
+    FEED_SIZE = 20  # newest posts in a feed
+    FEED_MAX_AGE = 60  # seconds readers may use their copy before revalidating
+
+    # rows per executemany / transaction of the `flask data` import and seed commands
+    DATA_BATCH_SIZE = 5000
+
+    # config for the rendered page cache (flaskblog.cache)
+    # "lru" keeps pages in process, "shared" in a redis compatible server at CACHE_SHARED_URL
+    # (local:// or unset uses an in-process stand-in), "null" disables caching. Invalidations of "lru" only reach the
+    # process that made the write, so it's for a single process: with several, the others serve stale pages until
+    # CACHE_TTL.
+    CACHE_TYPE = os.environ.get("CACHE_TYPE", "lru")
+    CACHE_SHARED_URL = os.environ.get("CACHE_URL")
+    CACHE_MAXSIZE = 512
+    CACHE_TTL = 300  # seconds, backstop for anything invalidation misses
+    # session user snapshots (models.load_user), same backend choices. Use "shared" with several app processes,
+    # so a change made through one process is seen by all of them.
+    USER_CACHE_TYPE = os.environ.get("USER_CACHE_TYPE", "lru")
+    USER_CACHE_MAXSIZE = 4096
+    USER_CACHE_TTL = 60
+
+    # config for password hashing (flaskblog.hashing)
+    BCRYPT_LOG_ROUNDS = 12  # stored hashes with another cost are re-hashed on the next login
+    HASHING_EXECUTOR = "process"  # "process" keeps bcrypt off the GIL, or "thread" / "inline"
+    HASHING_WORKERS = os.cpu_count() or 1
+    HASHING_MAX_PENDING = 4 * HASHING_WORKERS  # queued + running hashes before requests get a 503
+    HASHING_QUEUE_TIMEOUT = 2.0  # seconds to wait for a free slot
+
+    # config for static files (flaskblog.assets). `flask assets build` writes content-hashed copies (plus .gz / .br
+    # variants) to static/ASSETS_DIST_DIR, url_for("static", ...) links to those once the app is restarted.
+    ASSETS_FINGERPRINT = True
+    ASSETS_DIST_DIR = "dist"
+    ASSETS_MAX_AGE = 365 * 24 * 3600  # seconds, for files whose names change with their content
+    # load Bootstrap from static/vendor (fetched by `flask assets vendor`) instead of the CDN
+    ASSETS_VENDORED = os.environ.get("ASSETS_VENDORED", "").lower() in ("1", "true", "on")
+
+    # config for rate limiting (flaskblog.ratelimit). Token buckets per endpoint, one per client IP and one per
+    # account (the submitted email), as (requests, seconds): bursts of up to `requests`, refilled over `seconds`.
+    # Only POSTs are limited, unless a route sets "methods". Over the limit is a 429 before the form is even
+    # validated. "shared" keeps the buckets in the server at CACHE_SHARED_URL, so the limits hold across processes.
+    RATELIMIT_ENABLED = True
+    RATELIMIT_BACKEND = os.environ.get("RATELIMIT_BACKEND", "memory")
+    RATELIMIT_ROUTES = {
+        "users.login": {"ip": (20, 60), "account": (10, 300)},
+        "users.register": {"ip": (5, 600)},
+        "users.reset_request": {"ip": (5, 600), "account": (3, 3600)},
+    }
+
+    # config for avatar uploads (flaskblog.users.avatars)
+    MAX_CONTENT_LENGTH = 4 * 1024 * 1024  # bytes, larger uploads get a 413
+    AVATAR_SIZES = (125, 64, 250)  # px, the first one is the file stored in User.image_file
+    AVATAR_QUALITY = 85  # WebP quality
+    AVATAR_EXECUTOR = "thread"  # or "process"
+    AVATAR_WORKERS = 2
 
     # config for flask_mail
-    MAIL_SERVER = "smtp.gmail.com"
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    MAIL_SERVER = os.environ.get("MAIL_SERVER", "smtp.gmail.com")
+    MAIL_PORT = int(os.environ.get("MAIL_PORT", 587))
+    MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "1") == "1"
     MAIL_USERNAME = os.environ.get("EMAIL_USER")
     MAIL_PASSWORD = os.environ.get("EMAIL_PASS")
+
+    # config for the outgoing mail queue (flaskblog.outbox)
+    # requests only enqueue mail, a worker delivers it: this thread, or `flask outbox work` / `flask outbox drain`
+    MAIL_OUTBOX_WORKER = os.environ.get("MAIL_OUTBOX_WORKER") == "1"
+    MAIL_OUTBOX_BATCH_SIZE = 50  # messages per SMTP connection
+    MAIL_OUTBOX_MAX_ATTEMPTS = 5  # then the message is dead-lettered
+    MAIL_OUTBOX_BACKOFF = 30  # seconds before the first retry, doubling after every failed attempt
+    MAIL_OUTBOX_LEASE = 300  # seconds a worker may take for a batch before others retry it
+    MAIL_OUTBOX_POLL_INTERVAL = 5  # seconds
+
+
+class ProductionConfig(Config):
+    SECRET_KEY = os.environ.get("SECRET_KEY", Config.SECRET_KEY)
+
+    # production runs several app processes, which must all see the same pages, session users and invalidations.
+    # Point CACHE_URL at the server, or set CACHE_TYPE / USER_CACHE_TYPE = "lru" for a single process.
+    CACHE_TYPE = os.environ.get("CACHE_TYPE", "shared")
+    USER_CACHE_TYPE = os.environ.get("USER_CACHE_TYPE", "shared")
+
+    # WAL lets readers carry on while a writer commits, busy_timeout makes writers wait for the lock
+    # instead of failing with "database is locked". synchronous=NORMAL is durable in WAL mode except for
+    # the last commits before a power loss.
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,  # ms
+        "cache_size": -64000,  # negative means KiB, so 64 MB of page cache per connection
+        "mmap_size": 268435456,  # 256 MB
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    }
+    # pool sizing, overridable with a JSON object in the SQLALCHEMY_ENGINE_OPTIONS environment variable
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+        **json.loads(os.environ.get("SQLALCHEMY_ENGINE_OPTIONS", "{}")),
+    }
+    # views marked with @read_replica read from this database when it's set
+    SQLALCHEMY_BINDS = {"replica": os.environ["DATABASE_REPLICA_URL"]
+                        } if os.environ.get("DATABASE_REPLICA_URL") else {}
+
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    WTF_CSRF_ENABLED = False
+    BCRYPT_LOG_ROUNDS = 4
+    HASHING_EXECUTOR = "inline"
+    RATELIMIT_ENABLED = False  # test clients all come from one address
+    # fail list views that go over their SQL statement budget (see flaskblog.sqlstats.query_budget)
+    SQL_QUERY_BUDGET_ENFORCED = True
+
+
+# picked by create_app from the FLASKBLOG_CONFIG environment variable
+configs = {
+    "default": Config,
+    "production": ProductionConfig,
+    "test": TestConfig,
+}
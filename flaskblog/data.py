@@ -0,0 +1,317 @@
+import csv
+import itertools
+import json
+import math
+import random
+import re
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional
+
+import click
+import flask
+import flask.cli
+import sqlalchemy
+
+import flaskblog
+from flaskblog.models import Post, User
+from flaskblog.posts.utils import _post_fields, _reconcile_post_counters
+
+# columns moved by import / export, in file order
+USER_FIELDS = ("id", "username", "email", "image_file", "password")
+POST_FIELDS = ("id", "title", "content", "date_posted", "date_modified", "user_id")
+MODELS = {"users": (User, USER_FIELDS), "posts": (Post, POST_FIELDS)}
+
+_BCRYPT_HASH = re.compile(r"^\$2[abxy]?\$\d\d\$[./A-Za-z0-9]{53}$")
+
+# seeded text draws from this list with zipf weights, so search sees both very common and rare terms
+VOCABULARY = (
+    "the of and to in is you that it he was for on are as with his they at be this have from or one had by word but "
+    "not what all were we when your can said there use an each which she do how their if will up other about out "
+    "many then them these so some her would make like him into time has look two more write go see number no way "
+    "could people my than first water been call who oil its now find long down day did get come made may part flask "
+    "python blog post query index cache server request database template route session user login password email "
+    "avatar page feed search cursor batch worker queue latency throughput memory thread process sqlite engine pool"
+).split()
+_VOCABULARY_WEIGHTS = list(itertools.accumulate(
+    1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _format_for(path: str, given: Optional[str]) -> str:
+    if given:
+        return given
+    return "csv" if path.endswith(".csv") else "jsonl"
+
+
+def _open(path: str, mode: str):
+    if path == "-":
+        return click.get_text_stream("stdin" if mode == "r" else "stdout")
+    # newline="" keeps the \r\n inside post content as is, the csv module handles line endings itself
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _read_records(file, file_format: str) -> Iterator[dict]:
+    if file_format == "csv":
+        for record in csv.DictReader(file):
+            # csv has no null, empty cells fall back to the column defaults
+            yield {key: value for key, value in record.items() if value != ""}
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    # exports (and the JSON API) write naive UTC with a "Z"
+    return datetime.fromisoformat(value[:-1] if value.endswith("Z") else value)
+
+
+def _user_row(record: dict) -> dict:
+    password = record.get("password") or ""
+    if not _BCRYPT_HASH.match(password):
+        raise ValueError(
+            f"user {record.get('username')!r} has no bcrypt hash as password (plain text passwords aren't imported)")
+    return {
+        "id": int(record["id"]) if record.get("id") else None,
+        "username": record["username"],
+        "email": record["email"],
+        "image_file": record.get("image_file") or "default.jpg",
+        "password": password,
+    }
+
+
+def _post_row(record: dict, author_ids: dict) -> dict:
+    if record.get("user_id"):
+        user_id = int(record["user_id"])
+    elif record.get("author") in author_ids:  # e.g. posts exported from the JSON API
+        user_id = author_ids[record["author"]]
+    else:
+        raise ValueError(f"post {record.get('title')!r} has no known user_id or author")
+    date_posted = _parse_datetime(record.get("date_posted")) or datetime.utcnow()
+    return {
+        "id": int(record["id"]) if record.get("id") else None,
+        "title": record["title"],
+        "content": record["content"],
+        **_post_fields(record["content"]),
+        "date_posted": date_posted,
+        "date_modified": _parse_datetime(record.get("date_modified")) or date_posted,
+        "user_id": user_id,
+    }
+
+
+def _bulk_insert(model, rows: Iterable[dict], batch_size: int) -> int:
+    """Inserts `rows` with one executemany and one transaction per `batch_size` rows. A bad row only rolls back its
+    own batch, everything before it stays committed.
+
+    Returns:
+        int: number of rows inserted.
+    """
+    table = model.__table__
+    inserted = 0
+    for chunk in _chunks(rows, batch_size):
+        # executemany needs the same keys in every row: leave id to the database only if no row sets it
+        if all(row.get("id") is None for row in chunk):
+            chunk = [{key: value for key, value in row.items() if key != "id"} for row in chunk]
+        try:
+            flaskblog.db.session.execute(table.insert(), chunk)
+            flaskblog.db.session.commit()
+        except Exception:
+            flaskblog.db.session.rollback()
+            raise
+        inserted += len(chunk)
+    return inserted
+
+
+def _export_records(model, fields: List[str], batch_size: int) -> Iterator[dict]:
+    """Every row of `model` in id order, read `batch_size` rows at a time by seeking past the last id."""
+    columns = [getattr(model, field) for field in fields]
+    last_id = 0
+    while True:
+        batch = flaskblog.db.session.query(*columns).filter(model.id > last_id).order_by(
+            model.id).limit(batch_size).all()
+        if not batch:
+            return
+        for row in batch:
+            yield dict(row._mapping)
+        last_id = batch[-1].id
+
+
+def _serialize_value(value):
+    if isinstance(value, bytes):  # password hashes written by Flask-Bcrypt
+        return value.decode("ascii")
+    return value.isoformat() + "Z" if isinstance(value, datetime) else value
+
+
+def _invalidate_authors(user_ids: Iterable[int]):
+    """Drops the cached feed and user pages showing posts of `user_ids`."""
+    tags = ["feed"]
+    for chunk in _chunks(set(user_ids), 500):
+        tags += [f"user:{username}" for username,
+                 in flaskblog.db.session.query(User.username).filter(User.id.in_(chunk))]
+    flaskblog.cache.invalidate(*tags)
+
+
+def _seed_users(rng: random.Random, start_id: int, count: int, password_hash: str) -> Iterator[dict]:
+    for user_id in range(start_id, start_id + count):
+        yield {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+               "image_file": "default.jpg", "password": password_hash}
+
+
+def _words(rng: random.Random, count: int) -> List[str]:
+    return rng.choices(VOCABULARY, cum_weights=_VOCABULARY_WEIGHTS, k=count)
+
+
+def _seed_content(rng: random.Random) -> str:
+    # post lengths are roughly log-normal: mostly a few hundred words, a long tail of long reads
+    words = _words(rng, min(5000, max(10, int(rng.lognormvariate(math.log(150), 0.8)))))
+    paragraphs, sentences, start = [], [], 0
+    while start < len(words):
+        end = start + rng.randint(6, 20)
+        sentence = " ".join(words[start:end])
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        start = end
+        if len(sentences) == 4 or start >= len(words):
+            paragraphs.append(" ".join(sentences))
+            sentences = []
+    return "\r\n\r\n".join(paragraphs)  # what the post form submits
+
+
+def _seed_posts(rng: random.Random, start_id: int, count: int, author_ids: List[int],
+                start: datetime, days: int) -> Iterator[dict]:
+    # a few authors write most of the posts
+    author_weights = list(itertools.accumulate(
+        1 / rank ** 1.1 for rank in range(1, len(author_ids) + 1)))
+    mean_gap = days * 86400 / max(count, 1)
+    date_posted = start
+    for post_id in range(start_id, start_id + count):
+        date_posted += timedelta(seconds=rng.expovariate(1 / mean_gap))
+        title = " ".join(_words(rng, rng.randint(3, 10)))[:100]
+        content = _seed_content(rng)
+        yield {"id": post_id, "title": title[0].upper() + title[1:], "content": content, **_post_fields(content),
+               "date_posted": date_posted, "date_modified": date_posted,
+               "user_id": rng.choices(author_ids, cum_weights=author_weights)[0]}
+
+
+def init_app(app: flask.Flask):
+    app.config.setdefault("DATA_BATCH_SIZE", 5000)
+    app.cli.add_command(data_cli)
+
+
+data_cli = flask.cli.AppGroup("data", help="Bulk import / export and synthetic data.")
+
+_batch_size_option = click.option("--batch-size", type=int, default=None,
+                                  help="Rows per executemany / transaction. Defaults to DATA_BATCH_SIZE.")
+_format_option = click.option("--format", "file_format", type=click.Choice(["jsonl", "csv"]), default=None,
+                              help="File format. Defaults to csv for *.csv files, jsonl otherwise.")
+
+
+@data_cli.command("import")
+@click.argument("kind", type=click.Choice(list(MODELS)))
+@click.argument("path", type=click.Path(dir_okay=False, allow_dash=True))
+@_format_option
+@_batch_size_option
+def import_command(kind: str, path: str, file_format: Optional[str], batch_size: Optional[int]):
+    """Loads users or posts from a JSONL / CSV file ("-" for stdin). Passwords must be bcrypt hashes."""
+    model, _ = MODELS[kind]
+    file = _open(path, "r")
+    records = _read_records(file, _format_for(path, file_format))
+    author_ids = {}
+    if kind == "posts":
+        author_ids = dict(flaskblog.db.session.query(User.username, User.id))
+    touched = set()
+
+    def rows():
+        for number, record in enumerate(records, start=1):
+            try:
+                row = _user_row(record) if kind == "users" else _post_row(record, author_ids)
+            except (KeyError, ValueError) as e:
+                raise click.ClickException(f"record {number}: {e!r}")
+            if kind == "posts":
+                touched.add(row["user_id"])
+            yield row
+
+    try:
+        inserted = _bulk_insert(model, rows(), batch_size or flask.current_app.config["DATA_BATCH_SIZE"])
+    except sqlalchemy.exc.IntegrityError as e:  # e.g. an id or username that is taken
+        raise click.ClickException(f"{e.orig} (the batches before the failing one are imported)")
+    finally:
+        file.close()
+        if touched:
+            # bulk inserts skip posts.utils._count_posts, recounting is one pass over the user_id index
+            _reconcile_post_counters()
+            _invalidate_authors(touched)
+    click.echo(f"Imported {inserted} {kind}.")
+    if kind == "posts":
+        click.echo("The search index was updated by its triggers, no rebuild needed.")
+
+
+@data_cli.command("export")
+@click.argument("kind", type=click.Choice(list(MODELS)))
+@click.argument("path", type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@_format_option
+@_batch_size_option
+def export_command(kind: str, path: str, file_format: Optional[str], batch_size: Optional[int]):
+    """Writes all users (with their password hashes) or posts to a JSONL / CSV file, "-" for stdout."""
+    model, fields = MODELS[kind]
+    records = _export_records(model, list(fields), batch_size or flask.current_app.config["DATA_BATCH_SIZE"])
+    count = 0
+    with _open(path, "w") as file:
+        if _format_for(path, file_format) == "csv":
+            writer = csv.writer(file)
+            writer.writerow(fields)
+            for record in records:
+                writer.writerow([_serialize_value(record[field]) for field in fields])
+                count += 1
+        else:
+            for record in records:
+                file.write(json.dumps({field: _serialize_value(record[field]) for field in fields},
+                                      separators=(",", ":"), ensure_ascii=False) + "\n")
+                count += 1
+    if path != "-":
+        click.echo(f"Exported {count} {kind}.")
+
+
+@data_cli.command("seed")
+@click.option("--users", "n_users", type=int, default=100, show_default=True)
+@click.option("--posts", "n_posts", type=int, default=1000, show_default=True)
+@click.option("--seed", "seed", type=int, default=42, show_default=True,
+              help="The same seed on the same database gives the same data.")
+@click.option("--password", default="password", show_default=True, help="Password of every seeded user.")
+@click.option("--days", type=int, default=730, show_default=True, help="Posts are spread over this many days.")
+@_batch_size_option
+def seed_command(n_users: int, n_posts: int, seed: int, password: str, days: int, batch_size: Optional[int]):
+    """Adds synthetic users and posts, e.g. to build load-test datasets."""
+    rng = random.Random(seed)
+    batch_size = batch_size or flask.current_app.config["DATA_BATCH_SIZE"]
+    session = flaskblog.db.session
+    first_user = (session.query(flaskblog.db.func.max(User.id)).scalar() or 0) + 1
+    first_post = (session.query(flaskblog.db.func.max(Post.id)).scalar() or 0) + 1
+
+    # hashing once instead of per user is what makes seeding many users fast
+    password_hash = flaskblog.passwords.generate_password_hash(password)
+    _bulk_insert(User, _seed_users(rng, first_user, n_users, password_hash), batch_size)
+
+    author_ids = list(range(first_user, first_user + n_users)) if n_users else [
+        user_id for user_id, in session.query(User.id).order_by(User.id)]
+    if n_posts and not author_ids:
+        raise click.ClickException("No users to write the posts, seed some with --users.")
+    # posts continue after the newest existing one
+    start = session.query(flaskblog.db.func.max(Post.date_posted)).scalar() or datetime(2020, 1, 1)
+    with click.progressbar(length=n_posts, label="Seeding posts") as progress:
+        for chunk in _chunks(_seed_posts(rng, first_post, n_posts, author_ids, start, days), batch_size):
+            _bulk_insert(Post, chunk, batch_size)
+            progress.update(len(chunk))
+    if n_posts:
+        _reconcile_post_counters()
+        _invalidate_authors(set(author_ids))
+    click.echo(f"Seeded {n_users} users and {n_posts} posts.")
@@ -0,0 +1,77 @@
+import functools
+from typing import Callable
+
+import flask
+import flask_sqlalchemy
+import sqlalchemy
+from sqlalchemy import orm
+from sqlalchemy.pool import NullPool, QueuePool
+
+REPLICA_BIND = "replica"
+
+
+def _apply_pragmas(pragmas: dict, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+    """Sends the queries of views marked with @read_replica to the "replica" bind (when SQLALCHEMY_BINDS has one).
+    Flushes, i.e. anything writing, always go to the primary database.
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if (not self._flushing and flask.has_app_context() and flask.g.get("read_replica")
+                and REPLICA_BIND in (self.app.config.get("SQLALCHEMY_BINDS") or ())):
+            return self.db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """Flask-SQLAlchemy with read-replica routing and sqlite tuning: SQLITE_PRAGMAS are run on every new connection,
+    and a file database gets a real connection pool when SQLALCHEMY_ENGINE_OPTIONS sets a pool_size.
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        if sa_url.drivername.startswith("sqlite"):
+            # picked up by create_engine below, sqlalchemy.create_engine doesn't know it
+            options["sqlite_pragmas"] = app.config.get("SQLITE_PRAGMAS") or {}
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop("sqlite_pragmas", None)
+        if (sa_url.drivername.startswith("sqlite") and engine_opts.get("pool_size")
+                and engine_opts.get("poolclass") in (None, NullPool)):
+            # a sqlite file otherwise gets NullPool, i.e. a new connection (and a new run of the pragmas) per checkout
+            engine_opts["poolclass"] = QueuePool
+            engine_opts.setdefault("connect_args", {})[
+                "check_same_thread"] = False
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas:
+            sqlalchemy.event.listen(engine, "connect", functools.partial(
+                _apply_pragmas, pragmas))
+        return engine
+
+
+def read_replica(view: Callable) -> Callable:
+    """Marks a read-only view whose queries may be served by the read replica. Replicas lag behind the primary,
+    so only use it for views that can show slightly stale data.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        flask.g.read_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            flask.g.read_replica = False
+    return wrapper
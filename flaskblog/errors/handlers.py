@@ -1,5 +1,10 @@
+import math
+
 import flask
 
+from flaskblog.hashing import HashingBusy
+from flaskblog.ratelimit import RateLimited
+
 errors = flask.Blueprint("error", __name__)
 
 
@@ -18,5 +23,17 @@ def error_403(error):
 def error_500(error):
     return flask.render_template("errors/500.html"), 500
 
+
+@errors.app_errorhandler(HashingBusy)
+def error_hashing_busy(error):
+    # every password hashing worker is taken, ask the client to come back instead of queueing it
+    return flask.render_template("errors/503.html"), 503, {"Retry-After": "5"}
+
+
+@errors.app_errorhandler(RateLimited)
+def error_rate_limited(error):
+    # raised before the view, for clients submitting a login / registration / reset form too often
+    return flask.render_template("errors/429.html"), 429, {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+
 # there is another method called errorhandler instead of app_errorhandler 
 # but that is for current Blueprint, not entire application
@@ -0,0 +1,45 @@
+import flask
+
+import flaskblog
+from flaskblog.conditional import conditional
+from flaskblog.database import read_replica
+from flaskblog.feeds.utils import _feed_rows, _feed_validators, _render_feed
+from flaskblog.models import User
+from flaskblog.sqlstats import query_budget
+
+feeds = flask.Blueprint("feeds", __name__)
+
+MIMETYPES = {"atom": "application/atom+xml", "rss": "application/rss+xml"}
+
+
+def _feed_response(fmt: str, body: str) -> flask.Response:
+    response = flask.current_app.response_class(body, mimetype=MIMETYPES[fmt])
+    # readers poll, let them (and proxies) reuse a copy for a while before revalidating with the ETag
+    response.cache_control.public = True
+    response.cache_control.max_age = flask.current_app.config["FEED_MAX_AGE"]
+    return response
+
+
+# Feeds are cached rendered (flaskblog.cache) under the tags the post routes already invalidate, so a feed is only
+# rebuilt after a post of its stream changed. A poll with the ETag of the cached copy is answered with a 304
+# without touching the database.
+@feeds.route("/feed.<any(atom, rss):fmt>")
+@read_replica
+@flaskblog.cache.cached(lambda fmt: ["feed"])
+@conditional(lambda fmt: _feed_validators(fmt))
+@query_budget(2)  # newest posts with their authors + session user
+def site_feed(fmt: str):
+    title = flask.current_app.config["FEED_TITLE"]
+    return _feed_response(fmt, _render_feed(fmt, title, flask.url_for("main.home", _external=True), _feed_rows()))
+
+
+@feeds.route("/user/<string:username>/feed.<any(atom, rss):fmt>")
+@read_replica
+@flaskblog.cache.cached(lambda username, fmt: [f"user:{username}"])
+@conditional(lambda username, fmt: _feed_validators(fmt, username))
+@query_budget(3)  # user + their newest posts + session user
+def user_feed(username: str, fmt: str):
+    user = User.query.filter_by(username=username).first_or_404()
+    title = f"{flask.current_app.config['FEED_TITLE']} - {user.username}"
+    return _feed_response(fmt, _render_feed(
+        fmt, title, flask.url_for("users.user_posts", username=user.username, _external=True), _feed_rows(user.id)))
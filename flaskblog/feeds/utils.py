@@ -0,0 +1,137 @@
+import email.utils
+import functools
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Tuple
+
+import flask
+
+import flaskblog
+from flaskblog.models import Post, User
+
+DC_NS = "http://purl.org/dc/elements/1.1/"  # dc:creator, RSS has no author element without an email address
+ET.register_namespace("dc", DC_NS)
+
+# characters XML 1.0 doesn't allow, even escaped
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def _feed_rows(user_id: Optional[int] = None) -> List[tuple]:
+    """The FEED_SIZE newest posts (of one author), newest first. Seeks on the (date_posted, id) order of the
+    listing indexes, so it reads FEED_SIZE rows however many posts there are.
+    """
+    query = flaskblog.db.session.query(
+        # the stored HTML, the source text only of posts that haven't been rendered yet
+        Post.id, Post.title, Post.content_html, flaskblog.db.case((Post.content_html.is_(None), Post.content)),
+        Post.excerpt, Post.date_posted, Post.date_modified, User.username
+    ).join(User, Post.user_id == User.id)
+    if user_id is not None:
+        query = query.filter(Post.user_id == user_id)
+    return [tuple(row) for row in query.order_by(Post.date_posted.desc(), Post.id.desc()).limit(
+        flask.current_app.config["FEED_SIZE"])]
+
+
+def _feed_validators(fmt: str, username: Optional[str] = None) -> Optional[Tuple[Sequence, Optional[datetime]]]:
+    """ETag parts of a feed, from the ids and modification times of its entries and their authors. No Last-Modified:
+    deleting an older entry or renaming an author changes the feed without moving its newest date_modified.
+    """
+    query = flaskblog.db.session.query(Post.id, Post.date_modified, User.username, User.image_file).join(
+        User, Post.user_id == User.id)
+    if username is not None:
+        user_id = flaskblog.db.session.query(User.id).filter_by(username=username).scalar()
+        if user_id is None:
+            return None  # no such user, the view 404s
+        query = query.filter(Post.user_id == user_id)
+    rows = [tuple(row) for row in query.order_by(Post.date_posted.desc(), Post.id.desc()).limit(
+        flask.current_app.config["FEED_SIZE"])]
+    # both formats are served by the same endpoint, they need their own ETags
+    return (fmt, rows), None
+
+
+def _text(value: Optional[str]) -> str:
+    return _INVALID_XML.sub("", value or "")
+
+
+def _rfc3339(value: datetime) -> str:
+    return value.replace(microsecond=0).isoformat() + "Z"  # stored datetimes are naive UTC
+
+
+def _rfc822(value: datetime) -> str:
+    return email.utils.format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def _element(parent: ET.Element, tag: str, text: Optional[str] = None, **attributes) -> ET.Element:
+    element = ET.SubElement(parent, tag, attributes)
+    if text is not None:
+        element.text = _text(text)
+    return element
+
+
+def _children(element: ET.Element) -> str:
+    # the document is assembled as text around the cached entries, only the children of its head are serialized
+    return "".join(ET.tostring(child, encoding="unicode") for child in element)
+
+
+# Entries are serialized once per version of a post and reused across feeds and regenerations, so rebuilding a
+# feed after a new post only serializes the new entry. Keyed by every value the entry shows.
+@functools.lru_cache(maxsize=2048)
+def _atom_entry(row: tuple, post_url: str, author_url: str) -> str:
+    post_id, title, content_html, content, excerpt, date_posted, date_modified, username = row
+    entry = ET.Element("entry")
+    _element(entry, "id", post_url)
+    _element(entry, "title", title)
+    _element(entry, "link", rel="alternate", type="text/html", href=post_url)
+    _element(entry, "published", _rfc3339(date_posted))
+    _element(entry, "updated", _rfc3339(date_modified))
+    author = _element(entry, "author")
+    _element(author, "name", username)
+    _element(author, "uri", author_url)
+    if excerpt:
+        _element(entry, "summary", excerpt)
+    if content_html is not None:
+        _element(entry, "content", content_html, type="html")
+    else:
+        _element(entry, "content", content, type="text")
+    return ET.tostring(entry, encoding="unicode")
+
+
+@functools.lru_cache(maxsize=2048)
+def _rss_item(row: tuple, post_url: str, author_url: str) -> str:
+    post_id, title, content_html, content, excerpt, date_posted, date_modified, username = row
+    item = ET.Element("item")
+    _element(item, "title", title)
+    _element(item, "link", post_url)
+    _element(item, "guid", post_url, isPermaLink="true")
+    _element(item, "pubDate", _rfc822(date_posted))
+    _element(item, f"{{{DC_NS}}}creator", username)
+    _element(item, "description", content_html if content_html is not None else content)
+    return ET.tostring(item, encoding="unicode")
+
+
+def _render_feed(fmt: str, title: str, page_url: str, rows: List[tuple]) -> str:
+    """Atom or RSS 2.0 document of `rows` (from _feed_rows). `page_url` is the HTML page the feed follows."""
+    feed_url = flask.request.base_url
+    entry = _atom_entry if fmt == "atom" else _rss_item
+    entries = "".join(entry(row, flask.url_for("posts.post", post_id=row[0], _external=True),
+                            flask.url_for("users.user_posts", username=row[7], _external=True)) for row in rows)
+    # the newest modification, not the newest post: edits show up in readers too
+    updated = max((row[6] for row in rows), default=None) or datetime.utcnow()
+
+    if fmt == "atom":
+        head = ET.Element("feed")
+        _element(head, "id", feed_url)
+        _element(head, "title", title)
+        _element(head, "updated", _rfc3339(updated))
+        _element(head, "link", rel="self", type="application/atom+xml", href=feed_url)
+        _element(head, "link", rel="alternate", type="text/html", href=page_url)
+        return ('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">'
+                + _children(head) + entries + "</feed>\n")
+
+    channel = ET.Element("channel")
+    _element(channel, "title", title)
+    _element(channel, "link", page_url)
+    _element(channel, "description", title)
+    _element(channel, "lastBuildDate", _rfc822(updated))
+    return ('<?xml version="1.0" encoding="utf-8"?>\n'
+            f'<rss version="2.0" xmlns:dc="{DC_NS}"><channel>' + _children(channel) + entries + "</channel></rss>\n")
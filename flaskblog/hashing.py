@@ -0,0 +1,117 @@
+import concurrent.futures
+import os
+import threading
+import time
+from typing import Callable, Optional, Union
+
+import flask
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing executor has HASHING_MAX_PENDING jobs queued and none finished in time."""
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    # module level so process pool workers can unpickle it. bcrypt is imported on first use, in the process running it.
+    import bcrypt
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(pw_hash: bytes, password: bytes) -> bool:
+    import bcrypt
+    return bcrypt.checkpw(password, pw_hash)
+
+
+class PasswordHasher:
+    """bcrypt hashing on a bounded executor.
+
+    Every bcrypt call is a few hundred ms of pure CPU. Running it on a process pool keeps it off the GIL of the
+    request threads, and the bound on pending jobs turns an overload into a quick HashingBusy (a 503) instead of an
+    ever growing queue of requests waiting for a hash.
+    """
+
+    def __init__(self, app: Optional[flask.Flask] = None):
+        self.rounds = 12
+        self.queue_timeout = 2.0
+        self._executor = None
+        self._executor_args = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: flask.Flask):
+        app.config.setdefault("BCRYPT_LOG_ROUNDS", 12)
+        app.config.setdefault("HASHING_EXECUTOR", "process")
+        app.config.setdefault("HASHING_WORKERS", os.cpu_count() or 1)
+        app.config.setdefault("HASHING_MAX_PENDING",
+                              4 * app.config["HASHING_WORKERS"])
+        app.config.setdefault("HASHING_QUEUE_TIMEOUT", 2.0)
+        self.rounds = app.config["BCRYPT_LOG_ROUNDS"]
+        self.queue_timeout = app.config["HASHING_QUEUE_TIMEOUT"]
+        self.shutdown()
+        # the pool itself is started on first use, so it isn't forked before the server forks its workers
+        self._executor_args = (app.config["HASHING_EXECUTOR"],
+                               app.config["HASHING_WORKERS"])
+        self._slots = threading.BoundedSemaphore(
+            app.config["HASHING_MAX_PENDING"])
+
+    def _get_executor(self) -> Optional[concurrent.futures.Executor]:
+        with self._lock:
+            kind, workers = self._executor_args
+            if self._executor is None and kind != "inline":
+                if kind == "process":
+                    self._executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=workers)
+                else:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=workers, thread_name_prefix="hashing")
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _run(self, fn: Callable, *args):
+        start = time.perf_counter()
+        try:
+            return self._submit(fn, *args)
+        finally:
+            # queueing included, it's what the request waited for (see flaskblog.metrics)
+            if flask.has_app_context():
+                flask.g.hashing_seconds = flask.g.get(
+                    "hashing_seconds", 0.0) + time.perf_counter() - start
+
+    def _submit(self, fn: Callable, *args):
+        executor = self._get_executor()
+        if executor is None:  # HASHING_EXECUTOR = "inline"
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def generate_password_hash(self, password: str) -> str:
+        return self._run(_hash, password.encode("utf-8"), self.rounds).decode("utf-8")
+
+    def check_password_hash(self, pw_hash: Union[str, bytes], password: str) -> bool:
+        # rows written by Flask-Bcrypt can hold the hash as bytes
+        if isinstance(pw_hash, str):
+            pw_hash = pw_hash.encode("utf-8")
+        return self._run(_check, pw_hash, password.encode("utf-8"))
+
+    def needs_rehash(self, pw_hash: Union[str, bytes]) -> bool:
+        """Whether `pw_hash` was made with another work factor than BCRYPT_LOG_ROUNDS ($2b$<rounds>$...)."""
+        if isinstance(pw_hash, bytes):
+            return True  # also stores it back as text
+        try:
+            return int(pw_hash.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
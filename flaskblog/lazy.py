@@ -0,0 +1,38 @@
+import threading
+import weakref
+from typing import Any, Callable
+
+
+class LazyExtension:
+    """Stands in for a Flask extension that is only created, and its module only imported, when it's first used.
+
+    init_app calls made before that are remembered and replayed on the real extension, so it can be set up in
+    create_app like any other extension while workers that never use it never pay for importing it.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._extension = None
+        self._pending_apps = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        with self._lock:
+            if self._extension is None:
+                self._pending_apps.add(app)
+                return
+        self._extension.init_app(app)
+
+    def load(self) -> Any:
+        """The real extension, created (and set up for every app seen so far) on the first call."""
+        with self._lock:
+            if self._extension is None:
+                extension = self._factory()
+                for app in list(self._pending_apps):
+                    extension.init_app(app)
+                self._pending_apps.clear()
+                self._extension = extension
+            return self._extension
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
@@ -1,18 +1,25 @@
 import flask
 
-from flaskblog.models import Post
+import flaskblog
+from flaskblog import streaming
+from flaskblog.conditional import conditional
+from flaskblog.database import read_replica
+from flaskblog.posts.utils import _listing_validators, _paginate_posts, _post_listing, _post_listing_meta, _post_total
+from flaskblog.sqlstats import query_budget
 
 main = flask.Blueprint("main", __name__)
 
 
 @main.route("/")
 @main.route("/home")
+@read_replica
+@flaskblog.cache.cached(lambda: ["feed"])
+@conditional(lambda: _listing_validators(_post_listing_meta(), _post_total))
+@query_budget(3)  # posts (+ post counter for page numbers) + session user
 def home() -> str:
-    page = flask.request.args.get("page", 1, type=int)
-    posts = Post.query.order_by(
-        Post.date_posted.desc()).paginate(page=page, per_page=5)
+    posts = _paginate_posts(_post_listing(), _post_total)
     # path params are used to identify specific resources, while query params are used to sort / filter those resoures
-    return flask.render_template("home.html", posts=posts)
+    return streaming.render_template("home.html", posts=posts)
 
 
 @main.route("/about")
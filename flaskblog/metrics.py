@@ -0,0 +1,240 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import flask
+
+import flaskblog
+from flaskblog import outbox, ratelimit, sqlstats
+
+# seconds, the default buckets of the Prometheus client libraries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Counter:
+    """Monotonic counter, one series per combination of label values."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Histogram:
+    """Cumulative histogram like the Prometheus client's: per series a count per bucket, a sum and a count."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            all_series = {key: list(series) for key, series in self._series.items()}
+        for label_values, series in sorted(all_series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labels, label_values, le)} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {series[-1]}"
+
+
+class Gauge:
+    """Value read when the metrics are scraped, e.g. from the stats other modules keep. `type` can also be
+    "counter" for a value that only goes up. With `labels`, `read` returns a dict of label values -> value.
+    """
+
+    def __init__(self, name: str, help: str, read: Callable, type: str = "gauge", labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.type = type
+        self.labels = tuple(labels)
+
+    def samples(self) -> Iterable[str]:
+        if not self.labels:
+            yield f"{self.name} {_number(self.read())}"
+            return
+        for label_values, value in sorted(self.read().items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+REQUEST_SECONDS = Histogram("flaskblog_request_duration_seconds", "Time to produce a response, by endpoint.",
+                            ["endpoint", "method"])
+REQUESTS = Counter("flaskblog_requests_total", "Responses sent, by endpoint and status.",
+                   ["endpoint", "method", "status"])
+TEMPLATE_SECONDS = Histogram("flaskblog_template_render_seconds", "Time to render a template.", ["template"])
+SQL_STATEMENTS = Histogram("flaskblog_sql_statements_per_request", "SQL statements issued by a request.",
+                           ["endpoint"], buckets=(0, 1, 2, 3, 4, 5, 10, 20, 50, 100))
+SQL_SECONDS = Histogram("flaskblog_sql_duration_seconds_per_request", "Time a request spent executing SQL.",
+                        ["endpoint"])
+HASHING_SECONDS = Histogram("flaskblog_password_hashing_seconds_per_request",
+                            "Time a request spent hashing / checking passwords, queueing included.", ["endpoint"],
+                            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+OUTBOX_QUEUED_SECONDS = Histogram("flaskblog_outbox_queued_seconds",
+                                  "Time delivered emails waited in the outbox, from enqueueing to sending.",
+                                  buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 900.0, 1800.0, 3600.0))
+
+METRICS = [
+    REQUEST_SECONDS, REQUESTS, TEMPLATE_SECONDS, SQL_STATEMENTS, SQL_SECONDS, HASHING_SECONDS, OUTBOX_QUEUED_SECONDS,
+    Gauge("flaskblog_cache_hits_total", "Rendered page cache hits.",
+          lambda: flaskblog.cache.stats()["hits"], type="counter"),
+    Gauge("flaskblog_cache_misses_total", "Rendered page cache misses.",
+          lambda: flaskblog.cache.stats()["misses"], type="counter"),
+    Gauge("flaskblog_outbox_sent_total", "Emails delivered by this process.",
+          lambda: outbox.stats.sent, type="counter"),
+    Gauge("flaskblog_outbox_failed_total", "Failed email deliveries of this process.",
+          lambda: outbox.stats.failed, type="counter"),
+    Gauge("flaskblog_outbox_dead_total", "Emails this process gave up on.",
+          lambda: outbox.stats.dead, type="counter"),
+    Gauge("flaskblog_outbox_send_seconds_total", "Time this process spent in SMTP sends.",
+          lambda: outbox.stats.send_seconds, type="counter"),
+    Gauge("flaskblog_outbox_pending", "Emails waiting in the outbox.", outbox.queue_depth),
+    Gauge("flaskblog_ratelimit_throttled_total", "Requests rejected by the rate limiter, by endpoint and bucket.",
+          ratelimit.stats.snapshot, type="counter", labels=["endpoint", "bucket"]),
+]
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format. Figures are per process: with several server processes,
+    Prometheus scrapes each one (or sums them up) like it does with any multi-instance job.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def _start_request():
+    flask.g.request_start = time.perf_counter()
+    # an app context can outlive a single request (e.g. in tests), so only count what happens from here on
+    flask.g.request_baseline = (sqlstats.statement_count(), sqlstats.statement_seconds(),
+                                flask.g.get("template_seconds", 0.0), flask.g.get("hashing_seconds"))
+
+
+def _start_template(sender, template, context, **extra):
+    flask.g.setdefault("template_starts", []).append(time.perf_counter())
+
+
+def _end_template(sender, template, context, **extra):
+    starts = flask.g.get("template_starts")
+    if starts:
+        elapsed = time.perf_counter() - starts.pop()
+        flask.g.template_seconds = flask.g.get("template_seconds", 0.0) + elapsed
+        TEMPLATE_SECONDS.observe(elapsed, template.name or "<string>")
+
+
+def _message_sent(sender, send_seconds, queued_seconds, **extra):
+    OUTBOX_QUEUED_SECONDS.observe(queued_seconds)
+
+
+def _end_request(response: flask.Response) -> flask.Response:
+    start = flask.g.get("request_start")
+    if start is None:  # a before_request function of an extension failed before ours
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = flask.request.endpoint or "none"
+    method = flask.request.method
+    statements_before, sql_before, templates_before, hashing_before = flask.g.request_baseline
+    statements = sqlstats.statement_count() - statements_before
+    sql_seconds = sqlstats.statement_seconds() - sql_before
+    template_seconds = flask.g.get("template_seconds", 0.0) - templates_before
+    hashing_seconds = flask.g.get("hashing_seconds")
+    if hashing_seconds is not None:  # None: the request didn't hash at all
+        hashing_seconds = None if hashing_seconds == hashing_before else hashing_seconds - (hashing_before or 0.0)
+
+    REQUEST_SECONDS.observe(elapsed, endpoint, method)
+    REQUESTS.inc(1, endpoint, method, str(response.status_code))
+    SQL_STATEMENTS.observe(statements, endpoint)
+    SQL_SECONDS.observe(sql_seconds, endpoint)
+    if hashing_seconds is not None:
+        HASHING_SECONDS.observe(hashing_seconds, endpoint)
+
+    config = flask.current_app.config
+    if config["SLOW_REQUEST_THRESHOLD"] is not None and elapsed >= config["SLOW_REQUEST_THRESHOLD"]:
+        flask.current_app.logger.warning(
+            f"Slow request {method} {flask.request.full_path} ({endpoint}): {elapsed * 1000:.1f} ms, "
+            f"sql {sql_seconds * 1000:.1f} ms in {statements} statements, "
+            f"templates {template_seconds * 1000:.1f} ms, hashing {(hashing_seconds or 0) * 1000:.1f} ms")
+
+    if config["SERVER_TIMING"]:
+        # shows up in the browser's network panel. Streamed responses only account for the time until the first
+        # byte, the rest happens after this header is sent.
+        timings = [f"app;dur={elapsed * 1000:.1f}",
+                   f'db;dur={sql_seconds * 1000:.1f};desc="{statements} statements"',
+                   f"tpl;dur={template_seconds * 1000:.1f}"]
+        if hashing_seconds is not None:
+            timings.append(f"hash;dur={hashing_seconds * 1000:.1f}")
+        response.headers.add("Server-Timing", ", ".join(timings))
+    return response
+
+
+def metrics_view():
+    return flask.current_app.response_class(render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app: flask.Flask):
+    app.config.setdefault("METRICS_ENABLED", True)
+    app.config.setdefault("METRICS_PATH", "/metrics")
+    app.config.setdefault("SERVER_TIMING", False)
+    app.config.setdefault("SLOW_REQUEST_THRESHOLD", 1.0)  # seconds, None turns the log off
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.before_request(_start_request)
+    app.after_request(_end_request)
+    flask.before_render_template.connect(_start_template, app)
+    flask.template_rendered.connect(_end_template, app)
+    outbox.message_sent.connect(_message_sent, app)
+    app.add_url_rule(app.config["METRICS_PATH"], "metrics", metrics_view)
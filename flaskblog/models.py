@@ -2,18 +2,58 @@
 from datetime import datetime
 
 import flask
+import sqlalchemy
 import flaskblog
 
 from flask_login import UserMixin
 
-from itsdangerous.jws import TimedJSONWebSignatureSerializer as Serializer
+# for the reading time shown next to posts
+WORDS_PER_MINUTE = 200
 
 # Reloading the user from the user_id stored in the session.
 # type: ignore
 
 @flaskblog.login_manager.user_loader
 def load_user(userid):
-    return User.query.get(int(userid))
+    """Returns a cached UserSnapshot rather than a User row, sparing a query on every authenticated request."""
+    key = f"user:{int(userid)}"
+    fields = flaskblog.user_cache.get(key)
+    if fields is None:
+        user = User.query.get(int(userid))
+        if user is None:
+            return None
+        fields = {"id": user.id, "username": user.username,
+                  "email": user.email, "image_file": user.image_file}
+        flaskblog.user_cache.set(key, fields)
+    return UserSnapshot(**fields)
+
+
+def forget_session_user(user_id: int):
+    """Drops the cached snapshot of a user. Call it after committing changes to their username, email or avatar."""
+    flaskblog.user_cache.delete(f"user:{user_id}")
+
+
+class UserSnapshot(UserMixin):
+    """
+    Read-only copy of the User fields views and templates read off current_user. Views that modify the logged in
+    user load the User row by current_user.id.
+    """
+
+    def __init__(self, id: int, username: str, email: str, image_file: str):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.image_file = image_file
+
+    def __eq__(self, other):
+        # lets templates compare current_user with User rows, e.g. post.author == current_user
+        return isinstance(other, (User, UserSnapshot)) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"UserSnapshot('{self.username}', {self.email}, '{self.image_file}')"
 
 # The login manager extension expects the User model to have is_authenticated(), is_active(), is_anonymous(), get_id().
 # Extension provides a class, from which we can inherit these common methods.
@@ -30,8 +70,11 @@ class User(flaskblog.db.Model, UserMixin):
     email = flaskblog.db.Column(
         flaskblog.db.String(120), unique=True, nullable=False)
     image_file = flaskblog.db.Column(
-        flaskblog.db.String(20), nullable=False, default="default.jpg")  # going to be hashed
+        flaskblog.db.String(40), nullable=False, default="default.jpg")  # named by content hash, see users.avatars
     password = flaskblog.db.Column(flaskblog.db.String(60), nullable=False)
+    # maintained by posts.utils._count_posts, so listings never COUNT(*) the user's posts
+    post_count = flaskblog.db.Column(
+        flaskblog.db.Integer, nullable=False, default=0, server_default="0")
     # one to many
     posts = flaskblog.db.relationship("Post", backref="author", lazy=True)
     # setting as instance variables in constructor don't work
@@ -47,6 +90,7 @@ class User(flaskblog.db.Model, UserMixin):
         Returns:
             string: userid serialized by itsdangerous serializer
         """
+        from itsdangerous.jws import TimedJSONWebSignatureSerializer as Serializer  # only needed for resets
         s = Serializer(flask.current_app.config["SECRET_KEY"], expires_sec)
         return s.dumps({
             "user_id": self.id
@@ -62,6 +106,7 @@ class User(flaskblog.db.Model, UserMixin):
         Returns:
             obj: Decoded token. 
         """
+        from itsdangerous.jws import TimedJSONWebSignatureSerializer as Serializer
         s = Serializer(flask.current_app.config["SECRET_KEY"])
         try:
             user_id = s.loads(token)["user_id"]
@@ -79,15 +124,92 @@ class Post(flaskblog.db.Model):
     Post model has the table name automatically set to post (lowercase). Can set own table name, set a table name attr.
     """
 
+    # listings are ordered by (date_posted, id). id is the rowid, which sqlite appends to every index,
+    # so these cover the home feed and the per user feed without a sort step.
+    __table_args__ = (
+        flaskblog.db.Index("ix_post_user_id_date_posted",
+                           "user_id", "date_posted"),
+    )
+
     id = flaskblog.db.Column(flaskblog.db.Integer, primary_key=True)
     title = flaskblog.db.Column(flaskblog.db.String(100), nullable=False)
     date_posted = flaskblog.db.Column(
-        flaskblog.db.DateTime, nullable=False, default=datetime.utcnow)
+        flaskblog.db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # bumped on every UPDATE of the row, drives Last-Modified / ETag of the pages showing the post
+    date_modified = flaskblog.db.Column(
+        flaskblog.db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     content = flaskblog.db.Column(flaskblog.db.Text, nullable=False)
+    # derived from content whenever it's written (posts.utils._post_fields), so neither the post page nor the feeds
+    # render markup on a read, and listings never load content. NULL on rows from before the columns existed, until
+    # `flask posts rerender`.
+    content_html = flaskblog.db.Column(flaskblog.db.Text)  # sanitized, safe to output as is
+    renderer_version = flaskblog.db.Column(flaskblog.db.String(20))  # posts.rendering._stamp of content_html
+    excerpt = flaskblog.db.Column(flaskblog.db.Text)
+    word_count = flaskblog.db.Column(
+        flaskblog.db.Integer, nullable=False, default=0, server_default="0")
 
     user_id = flaskblog.db.Column(flaskblog.db.Integer, flaskblog.db.ForeignKey(
         "user.id"), nullable=False)
     # backref author
 
+    @property
+    def reading_minutes(self) -> int:
+        return max(1, round(self.word_count / WORDS_PER_MINUTE))
+
     def __repr__(self):
         return f"Post('{self.title}', '{self.date_posted}')"
+
+
+class Counter(flaskblog.db.Model):
+    """
+    Named counters maintained alongside the rows they count, e.g. "posts", the number of rows in post. Reading one
+    is a primary key lookup however large the counted table gets.
+    """
+
+    name = flaskblog.db.Column(flaskblog.db.String(50), primary_key=True)
+    value = flaskblog.db.Column(
+        flaskblog.db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"Counter('{self.name}', {self.value})"
+
+
+# a new database starts with no posts
+sqlalchemy.event.listen(Counter.__table__, "after_create",
+                        sqlalchemy.DDL("INSERT INTO counter (name, value) VALUES ('posts', 0)"))
+
+
+class OutboxMessage(flaskblog.db.Model):
+    """
+    Outgoing email waiting in the outbox table. Requests only add rows here, the outbox worker (flaskblog.outbox)
+    delivers them later, so a slow or failing SMTP server never holds up or breaks a request.
+    """
+
+    __tablename__ = "outbox"
+    # the worker polls for due pending messages
+    __table_args__ = (
+        flaskblog.db.Index("ix_outbox_status_next_attempt_at",
+                           "status", "next_attempt_at"),
+    )
+
+    id = flaskblog.db.Column(flaskblog.db.Integer, primary_key=True)
+    subject = flaskblog.db.Column(flaskblog.db.String(200), nullable=False)
+    sender = flaskblog.db.Column(flaskblog.db.String(120), nullable=False)
+    recipients = flaskblog.db.Column(
+        flaskblog.db.Text, nullable=False)  # comma separated
+    body = flaskblog.db.Column(flaskblog.db.Text, nullable=False)
+    # pending -> sent, or dead once MAIL_OUTBOX_MAX_ATTEMPTS deliveries failed
+    status = flaskblog.db.Column(
+        flaskblog.db.String(10), nullable=False, default="pending")
+    attempts = flaskblog.db.Column(
+        flaskblog.db.Integer, nullable=False, default=0)
+    # when the message is due. Also serves as the lease of the worker that claimed it.
+    next_attempt_at = flaskblog.db.Column(
+        flaskblog.db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = flaskblog.db.Column(flaskblog.db.Text)
+    created_at = flaskblog.db.Column(
+        flaskblog.db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = flaskblog.db.Column(flaskblog.db.DateTime)
+
+    def __repr__(self):
+        return f"OutboxMessage('{self.subject}', '{self.recipients}', '{self.status}')"
@@ -0,0 +1,212 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import click
+import flask
+import flask.cli
+
+import flaskblog
+from flaskblog.models import OutboxMessage
+
+
+class OutboxStats:
+    """Per-process delivery figures of the outbox worker."""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0
+        self.send_seconds = 0.0  # time spent in SMTP sends
+        self.queued_seconds = 0.0  # enqueue to delivery, of the sent messages
+        self._lock = threading.Lock()
+
+    def record_sent(self, send_seconds: float, queued_seconds: float):
+        with self._lock:
+            self.sent += 1
+            self.send_seconds += send_seconds
+            self.queued_seconds += queued_seconds
+
+    def record_failed(self, dead: bool):
+        with self._lock:
+            self.failed += 1
+            self.dead += dead
+
+
+stats = OutboxStats()
+
+# sent with the app, send_seconds and queued_seconds for every delivered message, flaskblog.metrics records them
+_signals = flask.signals.Namespace()
+message_sent = _signals.signal("outbox-message-sent")
+
+
+def enqueue(subject: str, recipients: List[str], body: str, sender: str = None):
+    """Adds a message to the outbox in the current session, to be committed by the caller with the rest of the
+    request's changes. Takes the fields of a flask_mail.Message, which is only built (and flask_mail imported) by the
+    worker delivering it.
+    """
+    flaskblog.db.session.add(OutboxMessage(
+        subject=subject,
+        sender=sender or flask.current_app.config.get("MAIL_DEFAULT_SENDER"),
+        recipients=",".join(recipients),
+        body=body,
+    ))
+
+
+def queue_depth() -> int:
+    """Number of messages still waiting to be delivered."""
+    return OutboxMessage.query.filter_by(status="pending").count()
+
+
+def _claim(batch_size: int) -> List[OutboxMessage]:
+    """Leases up to `batch_size` due messages to this worker by pushing their next_attempt_at past the lease time.
+    The UPDATE only matches while the row still has the next_attempt_at we read, so two workers never claim the same
+    message, and messages of a worker that died become due again when the lease runs out.
+    """
+    config = flask.current_app.config
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=config["MAIL_OUTBOX_LEASE"])
+    due = OutboxMessage.query.filter(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now).order_by(
+        OutboxMessage.next_attempt_at, OutboxMessage.id).limit(batch_size).all()
+
+    claimed = [message.id for message in due if OutboxMessage.query.filter_by(
+        id=message.id, next_attempt_at=message.next_attempt_at).update(
+        {"next_attempt_at": lease_until}, synchronize_session=False)]
+    flaskblog.db.session.commit()
+    return OutboxMessage.query.filter(OutboxMessage.id.in_(claimed)).order_by(OutboxMessage.id).all() if claimed else []
+
+
+def _failed(message: OutboxMessage, error: Exception):
+    config = flask.current_app.config
+    message.attempts += 1
+    message.last_error = repr(error)
+    if message.attempts >= config["MAIL_OUTBOX_MAX_ATTEMPTS"]:
+        message.status = "dead"  # dead-lettered, left in the table for inspection
+    else:
+        # exponential backoff: BACKOFF, 2 * BACKOFF, 4 * BACKOFF ... seconds
+        delay = config["MAIL_OUTBOX_BACKOFF"] * 2 ** (message.attempts - 1)
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+    stats.record_failed(dead=message.status == "dead")
+
+
+def drain(batch_size: int = None) -> int:
+    """Delivers one batch of due messages over a single SMTP connection.
+
+    Args:
+        batch_size (int, optional): messages to claim. Defaults to MAIL_OUTBOX_BATCH_SIZE.
+
+    Returns:
+        int: number of messages claimed (sent or not). 0 means the outbox had nothing due.
+    """
+    batch = _claim(batch_size or flask.current_app.config["MAIL_OUTBOX_BATCH_SIZE"])
+    if not batch:
+        return 0
+
+    import smtplib
+
+    import flask_mail
+
+    pending = list(batch)
+    try:
+        with flaskblog.mail.connect() as connection:
+            while pending:
+                message = pending[0]
+                start = time.perf_counter()
+                try:
+                    connection.send(flask_mail.Message(subject=message.subject, sender=message.sender,
+                                                       recipients=message.recipients.split(","), body=message.body))
+                except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                    _failed(message, e)  # the server refused this message, the connection is still fine
+                except OSError:
+                    raise  # the connection is gone, handled for the whole rest of the batch below
+                except Exception as e:  # bad headers ...
+                    _failed(message, e)
+                else:
+                    message.status = "sent"
+                    message.sent_at = datetime.utcnow()
+                    send_seconds = time.perf_counter() - start
+                    queued_seconds = (message.sent_at - message.created_at).total_seconds()
+                    stats.record_sent(send_seconds, queued_seconds)
+                    message_sent.send(flask.current_app._get_current_object(),  # type: ignore
+                                      send_seconds=send_seconds, queued_seconds=queued_seconds)
+                pending.pop(0)
+    except Exception as e:  # couldn't connect or lost the connection
+        flask.current_app.logger.warning(f"Outbox delivery failed: {e!r}")
+        for message in pending:
+            _failed(message, e)
+    flaskblog.db.session.commit()
+    return len(batch)
+
+
+class OutboxWorker(threading.Thread):
+    """Background thread that keeps draining the outbox, sleeping MAIL_OUTBOX_POLL_INTERVAL when it's empty."""
+
+    def __init__(self, app: flask.Flask):
+        super().__init__(name="outbox-worker", daemon=True)
+        self.app = app
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            with self.app.app_context():
+                try:
+                    claimed = drain()
+                except Exception:
+                    self.app.logger.exception("Outbox worker error")
+                    flaskblog.db.session.rollback()
+                    claimed = 0
+                finally:
+                    flaskblog.db.session.remove()
+            if not claimed:
+                self.stopped.wait(self.app.config["MAIL_OUTBOX_POLL_INTERVAL"])
+
+    def stop(self):
+        self.stopped.set()
+
+
+def init_app(app: flask.Flask):
+    app.config.setdefault("MAIL_OUTBOX_WORKER", False)
+    app.config.setdefault("MAIL_OUTBOX_BATCH_SIZE", 50)
+    app.config.setdefault("MAIL_OUTBOX_MAX_ATTEMPTS", 5)
+    app.config.setdefault("MAIL_OUTBOX_BACKOFF", 30)
+    app.config.setdefault("MAIL_OUTBOX_LEASE", 300)
+    app.config.setdefault("MAIL_OUTBOX_POLL_INTERVAL", 5)
+    app.cli.add_command(outbox_cli)
+    if app.config["MAIL_OUTBOX_WORKER"]:
+        app.extensions["outbox_worker"] = OutboxWorker(app)
+        app.extensions["outbox_worker"].start()
+
+
+outbox_cli = flask.cli.AppGroup("outbox", help="Outgoing email queue.")
+
+
+@outbox_cli.command("drain")
+def drain_command():
+    """Delivers every due message, then exits (e.g. from cron)."""
+    total = 0
+    while True:
+        claimed = drain()
+        if not claimed:
+            break
+        total += claimed
+    click.echo(f"Processed {total} messages, {queue_depth()} still pending.")
+
+
+@outbox_cli.command("work")
+def work_command():
+    """Runs the outbox worker in the foreground."""
+    worker = OutboxWorker(flask.current_app._get_current_object())  # type: ignore
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(1)
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+@outbox_cli.command("status")
+def status_command():
+    """Shows the number of pending and dead-lettered messages."""
+    dead = OutboxMessage.query.filter_by(status="dead").count()
+    click.echo(f"pending: {queue_depth()}  dead: {dead}")
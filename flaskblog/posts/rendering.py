@@ -0,0 +1,108 @@
+import html
+import re
+from html.parser import HTMLParser
+from typing import Tuple
+
+# Bump a renderer's version whenever its output for the same source changes (markdown extensions, allowed tags...),
+# then run `flask posts rerender` to bring the stored HTML of older posts up to date.
+RENDERER_VERSIONS = {
+    "markdown": 1,
+    "plain": 1,  # paragraphs and line breaks of the text as is, the way posts were shown before markdown
+}
+
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "sane_lists"]
+
+# what survives sanitizing: anything else the author writes as raw HTML is stripped, its text kept
+ALLOWED_TAGS = ["p", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6", "strong", "em", "b", "i", "del", "code", "pre",
+                "blockquote", "ul", "ol", "li", "a", "img", "table", "thead", "tbody", "tr", "th", "td", "abbr"]
+ALLOWED_ATTRIBUTES = {
+    "a": ["href", "title", "rel"],
+    "img": ["src", "alt", "title"],
+    "abbr": ["title"],
+    "th": ["align"],
+    "td": ["align"],
+    "code": ["class"],  # language-* of fenced code blocks
+}
+ALLOWED_PROTOCOLS = ["http", "https", "mailto"]
+
+_BLANK_LINES = re.compile(r"\n\s*\n")
+
+
+def _stamp(markup: str) -> str:
+    """Version stamp stored with the HTML of a post, e.g. "markdown-1"."""
+    return f"{markup}-{RENDERER_VERSIONS[markup]}"
+
+
+def _check_markup(markup: str):
+    """Fails at startup, rather than on the first post written, when POST_MARKUP is unknown or its packages aren't
+    installed.
+    """
+    if markup not in RENDERER_VERSIONS:
+        raise ValueError(f"Unknown post markup {markup!r}")
+    if markup == "markdown":
+        try:
+            import bleach  # noqa: F401
+            import markdown  # noqa: F401
+        except ImportError as error:
+            raise RuntimeError(f'POST_MARKUP = "markdown" needs the markdown and bleach packages ({error}), '
+                               f'install them or set POST_MARKUP = "plain"') from error
+
+
+def _markdown(source: str) -> str:
+    # imported on the first render, not by every worker at startup
+    import bleach
+    import markdown
+    rendered = markdown.markdown(source, extensions=MARKDOWN_EXTENSIONS, output_format="html")
+    cleaned = bleach.clean(rendered, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, protocols=ALLOWED_PROTOCOLS,
+                           strip=True)
+    # bare URLs become links, rel="nofollow" on every link
+    return bleach.linkify(cleaned, skip_tags=["pre", "code"])
+
+
+def _plain(source: str) -> str:
+    paragraphs = [paragraph.strip() for paragraph in _BLANK_LINES.split(source.replace("\r\n", "\n"))]
+    return "\n".join("<p>" + html.escape(paragraph).replace("\n", "<br>\n") + "</p>"
+                     for paragraph in paragraphs if paragraph)
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_data(self, data: str):
+        self.parts.append(data)
+
+    def handle_starttag(self, tag: str, attrs):
+        self.parts.append(" ")  # <p>a</p><p>b</p> is two words
+
+
+def _plain_text(rendered: str) -> str:
+    """The text of rendered HTML, what a reader sees without the markup."""
+    extractor = _TextExtractor()
+    extractor.feed(rendered)
+    extractor.close()
+    return "".join(extractor.parts)
+
+
+def _summarize(text: str, length: int) -> Tuple[str, int]:
+    """Excerpt (the first `length` characters, cut at a word, whitespace collapsed) and word count of a post's
+    text.
+    """
+    words = text.split()
+    excerpt = " ".join(words)
+    if len(excerpt) > length:
+        cut = excerpt.rfind(" ", 0, length + 1)
+        excerpt = excerpt[:cut if cut > 0 else length].rstrip(" ,.;:-") + "…"
+    return excerpt, len(words)
+
+
+def _render(content: str, markup: str, excerpt_length: int) -> dict:
+    """Sanitized HTML of a post's source along with its renderer stamp, excerpt and word count (both of the text the
+    reader sees, not of the markdown source). Runs in the `flask posts rerender` workers too, so it only takes
+    picklable arguments and doesn't need the app.
+    """
+    rendered = _markdown(content) if markup == "markdown" else _plain(content)
+    excerpt, word_count = _summarize(_plain_text(rendered), excerpt_length)
+    return {"content_html": rendered, "renderer_version": _stamp(markup), "excerpt": excerpt,
+            "word_count": word_count}
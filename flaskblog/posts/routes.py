@@ -1,11 +1,18 @@
-from typing import Union
+from typing import Optional, Union
+import click
 import flask
 import flask_login
 from werkzeug.wrappers.response import Response
 import flaskblog
+from flaskblog import streaming
 from flaskblog.models import Post
 
 from flaskblog.posts.forms import PostForm
+from flaskblog.conditional import conditional
+from flaskblog.database import read_replica
+from flaskblog.posts.utils import (_count_posts, _post_listing, _post_validators, _reconcile_post_counters,
+                                   _rerender_posts, _set_content)
+from flaskblog.sqlstats import query_budget
 
 posts = flask.Blueprint("posts", __name__)
 
@@ -17,25 +24,31 @@ def new_post() -> Union[str, Response]:
 
     if form.validate_on_submit():
         flask.flash("Your post has been created!", "success")
-        post = Post(title=form.title.data, content=form.content.data,
-                    author=flask_login.current_user)
+        post = Post(title=form.title.data, user_id=flask_login.current_user.id)  # type: ignore
+        _set_content(post, form.content.data)
         flaskblog.db.session.add(post)
+        _count_posts(post.user_id, 1)
         flaskblog.db.session.commit()
+        flaskblog.cache.invalidate("feed", f"user:{post.author.username}")
         return flask.redirect(flask.url_for("main.home"))
 
     return flask.render_template("create_post.html", title="New Post", form=form, legend="New Post")
 
 
 @posts.route("/post/<int:post_id>")  # variables of int type in route
+@read_replica
+@flaskblog.cache.cached(lambda post_id: [f"post:{post_id}"])
+@conditional(_post_validators)
+@query_budget(2)  # post with its author + session user
 def post(post_id) -> str:
     """GETs post of passed in post_id in the URL. Single page view of the required post. 
 
     Args:
         post_id (int): post_id of post to GET. int: in route restricts type of var. 
     """
-    post = Post.query.get_or_404(
+    post = _post_listing(content=True).get_or_404(
         post_id)  # if it does not exist return 404. If exists, render a template with that post
-    return flask.render_template("post.html", title=post.title, post=post)
+    return streaming.render_template("post.html", title=post.title, post=post)
 
 
 @posts.route("/post/<int:post_id>/update", methods=["GET", "POST"])
@@ -49,8 +62,10 @@ def update_post(post_id) -> Union[str, Response]:
 
     if form.validate_on_submit():
         post.title = form.title.data
-        post.content = form.content.data
+        _set_content(post, form.content.data)
         flaskblog.db.session.commit()
+        flaskblog.cache.invalidate(
+            "feed", f"post:{post.id}", f"user:{post.author.username}")
         flask.flash("Your post has been updated!", "success")
         return flask.redirect(flask.url_for("posts.post", post_id=post.id))
     elif flask.request.method == "GET":
@@ -71,6 +86,29 @@ def delete_post(post_id) -> Response:
         flask.abort(403)
 
     flaskblog.db.session.delete(post)
+    _count_posts(post.user_id, -1)
     flaskblog.db.session.commit()
+    flaskblog.cache.invalidate(
+        "feed", f"post:{post_id}", f"user:{flask_login.current_user.username}")  # type: ignore
     flask.flash("Your post has been deleted!", "success")
     return flask.redirect(flask.url_for("main.home"))
+
+
+@posts.cli.command("reconcile-counters")
+def reconcile_counters_command():
+    """Recounts the global and per user post counters from the post table, fixing any drift."""
+    drifted = _reconcile_post_counters()
+    flaskblog.cache.invalidate("feed")
+    click.echo(f"Post counters reconciled, {drifted} were off.")
+
+
+@posts.cli.command("rerender")
+@click.option("--all", "everything", is_flag=True, help="Re-render every post, not only the out of date ones.")
+@click.option("--batch-size", type=int, default=1000, show_default=True, help="Posts per transaction.")
+@click.option("--workers", type=int, default=None, help="Rendering processes.  [default: number of CPUs]")
+def rerender_command(everything: bool, batch_size: int, workers: Optional[int]):
+    """Stores HTML, excerpt and word count of posts rendered by an older renderer version or not at all (or of all
+    posts with --all).
+    """
+    updated = _rerender_posts(batch_size, everything, workers)
+    click.echo(f"{updated} posts rendered.")
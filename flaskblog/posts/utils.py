@@ -0,0 +1,256 @@
+import base64
+import binascii
+import concurrent.futures
+import itertools
+import os
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import flask
+import flask_sqlalchemy
+import flaskblog
+from flaskblog.models import Counter, Post, User
+from flaskblog.posts.rendering import _render, _stamp
+
+
+class SeekPage:
+    """One page of posts selected by keyset (seek) pagination. Instead of OFFSET-ing past every earlier row, the
+    page is located by the (date_posted, id) of the row it continues from, so the index walk starts right there.
+    Cursors are stable: new posts don't shift the contents of a page like they do with page numbers.
+    """
+
+    def __init__(self, items: List[Post], next_cursor: Optional[str], prev_cursor: Optional[str]):
+        self.items = items
+        self.next_cursor = next_cursor  # older posts
+        self.prev_cursor = prev_cursor  # newer posts
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def _post_listing(content: bool = False):
+    """Base query for lists of posts. Templates render the author of every post, so authors are joined into the
+    same SELECT instead of being lazy loaded one post at a time (N+1 queries).
+
+    Args:
+        content (bool, optional): load `content` and `content_html` too. Lists only show the stored excerpt, so by
+            default the columns aren't read at all. Defaults to False.
+    """
+    query = Post.query.options(flaskblog.db.joinedload(Post.author))
+    return query if content else query.options(flaskblog.db.defer(Post.content), flaskblog.db.defer(Post.content_html))
+
+
+def _post_listing_meta():
+    """Same rows as _post_listing(), but only the columns that decide whether a rendered page changed, so conditional
+    GETs can be answered without loading `content`.
+    """
+    return flaskblog.db.session.query(
+        Post.id, Post.date_posted, Post.date_modified, User.username, User.image_file).join(User, Post.user_id == User.id)
+
+
+def _encode_cursor(post: Post) -> str:
+    raw = f"{post.date_posted.isoformat()}|{post.id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of _encode_cursor. Aborts with 400 on a tampered or truncated cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        date_posted, post_id = raw.split("|")
+        return datetime.fromisoformat(date_posted), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        flask.abort(400)
+
+
+def _seek_paginate(query, after: Optional[str] = None, before: Optional[str] = None,
+                   per_page: int = 5) -> SeekPage:
+    """Pages through `query` newest first on (date_posted, id).
+
+    Args:
+        query: Post query, optionally filtered (e.g. by author). Must not be ordered yet.
+        after (str, optional): cursor of the last post of the previous page, to move to older posts.
+        before (str, optional): cursor of the first post of the next page, to move back to newer posts.
+        per_page (int, optional): posts per page. Defaults to 5.
+
+    Returns:
+        SeekPage: the posts of the page along with cursors to its neighbours.
+    """
+    key = flaskblog.db.tuple_(Post.date_posted, Post.id)
+
+    if before:
+        # walk the index upwards from the cursor, then flip the page back to newest first
+        rows = query.filter(key > _decode_cursor(before)).order_by(
+            Post.date_posted.asc(), Post.id.asc()).limit(per_page + 1).all()
+        items = rows[:per_page][::-1]
+        has_newer, has_older = len(rows) > per_page, True
+    else:
+        if after:
+            query = query.filter(key < _decode_cursor(after))
+        # one extra row tells us whether there is a next page, without a COUNT(*)
+        rows = query.order_by(
+            Post.date_posted.desc(), Post.id.desc()).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_newer, has_older = after is not None, len(rows) > per_page
+
+    return SeekPage(
+        items,
+        next_cursor=_encode_cursor(items[-1]) if items and has_older else None,
+        prev_cursor=_encode_cursor(items[0]) if items and has_newer else None,
+    )
+
+
+def _post_fields(content: str) -> dict:
+    """The columns derived from a post's source: sanitized HTML in POST_MARKUP with its renderer stamp, excerpt and
+    word count. Wherever content is written, store these along with it.
+    """
+    config = flask.current_app.config
+    return _render(content, config["POST_MARKUP"], config["POST_EXCERPT_LENGTH"])
+
+
+def _set_content(post: Post, content: str):
+    post.content = content
+    for name, value in _post_fields(content).items():
+        setattr(post, name, value)
+
+
+def _rerender_posts(batch_size: int, everything: bool = False, workers: Optional[int] = None) -> int:
+    """Renders the posts whose stored HTML is missing or from another renderer (version) than POST_MARKUP's current
+    one, along with their excerpt and word count, `batch_size` posts (and one transaction) at a time. The rendering
+    of a batch is spread over a pool of `workers` processes. With `everything`, re-renders every post, e.g. after
+    changing POST_EXCERPT_LENGTH.
+
+    Returns:
+        int: number of posts updated.
+    """
+    config = flask.current_app.config
+    markup, length = config["POST_MARKUP"], config["POST_EXCERPT_LENGTH"]
+    session = flaskblog.db.session
+    table = Post.__table__
+    update = table.update().where(table.c.id == flaskblog.db.bindparam("post_id")).values(
+        **{name: flaskblog.db.bindparam(f"new_{name}")
+           for name in ("content_html", "renderer_version", "excerpt", "word_count")})
+    workers = workers or os.cpu_count() or 1
+    updated, last_id = 0, 0
+    # markdown is pure Python, processes rather than threads so the rendering isn't serialized on the GIL
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            query = session.query(Post.id, Post.content, Post.user_id).filter(Post.id > last_id)
+            if not everything:
+                query = query.filter(flaskblog.db.or_(Post.renderer_version.is_(None),
+                                                      Post.renderer_version != _stamp(markup)))
+            batch = query.order_by(Post.id).limit(batch_size).all()
+            if not batch:
+                return updated
+            rendered = executor.map(_render, [content for _, content, _ in batch], itertools.repeat(markup),
+                                    itertools.repeat(length), chunksize=max(1, len(batch) // (4 * workers)))
+            rows = [{"post_id": post_id, **{f"new_{name}": value for name, value in fields.items()}}
+                    for (post_id, _, _), fields in zip(batch, rendered)]
+            # date_modified moves on too (its onupdate), the pages showing these posts change
+            session.execute(update, rows)
+            session.commit()
+            authors = session.query(User.username).filter(User.id.in_({user_id for _, _, user_id in batch}))
+            flaskblog.cache.invalidate("feed", *[f"user:{username}" for username, in authors],
+                                       *[f"post:{post_id}" for post_id, _, _ in batch])
+            updated += len(rows)
+            last_id = batch[-1].id
+
+
+def _count_posts(user_id: int, delta: int):
+    """Adds `delta` to the global post counter and the author's post_count, in the current transaction. Call it
+    wherever posts are added or deleted one at a time, next to the INSERT / DELETE. The counters are incremented in
+    SQL, so concurrent writers can't lose updates.
+    """
+    flaskblog.db.session.query(Counter).filter_by(name="posts").update(
+        {Counter.value: Counter.value + delta}, synchronize_session=False)
+    flaskblog.db.session.query(User).filter_by(id=user_id).update(
+        {User.post_count: User.post_count + delta}, synchronize_session=False)
+
+
+def _post_total() -> int:
+    """Number of posts, from the counter."""
+    return flaskblog.db.session.query(Counter.value).filter_by(name="posts").scalar() or 0
+
+
+def _reconcile_post_counters() -> int:
+    """Recounts the post counters from the post table, e.g. after bulk loads or to repair drift.
+
+    Returns:
+        int: number of counters that were wrong.
+    """
+    session = flaskblog.db.session
+    actual = session.query(flaskblog.db.func.count(Post.id)).filter(Post.user_id == User.id).scalar_subquery()
+    drifted = session.query(User.id).filter(User.post_count != actual).count()
+    session.query(User).update({User.post_count: actual}, synchronize_session=False)
+
+    total = session.query(flaskblog.db.func.count(Post.id)).scalar()
+    counter = session.query(Counter).get("posts")
+    if counter is None:
+        counter = Counter(name="posts", value=0)
+        session.add(counter)
+    drifted += counter.value != total
+    counter.value = total
+    session.commit()
+    return drifted
+
+
+def _offset_paginate(query, page: int, per_page: int, total: int) -> flask_sqlalchemy.Pagination:
+    """query.paginate() without its COUNT(*) query, for listings whose `total` is known from a counter."""
+    if page < 1:
+        flask.abort(404)
+    items = query.limit(per_page).offset((page - 1) * per_page).all()
+    if not items and page != 1:
+        flask.abort(404)
+    return flask_sqlalchemy.Pagination(query, page, per_page, total, items)
+
+
+def _paginate_posts(query, total: Optional[Callable[[], int]] = None):
+    """Paginates a post listing as requested by the current request's query params. ?after= / ?before= cursors
+    use keyset pagination, ?page= (or POSTS_PAGINATION = "offset") keeps the old page-number pagination.
+
+    Args:
+        query: post listing query.
+        total (callable, optional): returns the number of posts in the listing, for the page numbers. Without it,
+            page-number pagination counts them with COUNT(*).
+    """
+    per_page = flask.current_app.config["POSTS_PER_PAGE"]
+    args = flask.request.args
+
+    if "page" in args or flask.current_app.config["POSTS_PAGINATION"] == "offset":
+        page = args.get("page", 1, type=int)
+        query = query.order_by(Post.date_posted.desc(), Post.id.desc())
+        if total is None:
+            return query.paginate(page=page, per_page=per_page)
+        return _offset_paginate(query, page, per_page, total())
+
+    return _seek_paginate(query, after=args.get("after"), before=args.get("before"), per_page=per_page)
+
+
+def _listing_validators(query, total: Optional[Callable[[], int]] = None) -> Tuple[Sequence, Optional[datetime]]:
+    """ETag parts of the page of a _post_listing_meta() query the current request asks for.
+
+    Listings get no Last-Modified: deleting a post, logging in or out and new pagination links all change the page
+    without moving the newest date_modified on it, so If-Modified-Since would be answered with stale 304s. The ETag
+    covers all of them.
+    """
+    page = _paginate_posts(query, total)
+    rows = [tuple(row) for row in page.items]
+    # the pagination links are part of the page too
+    links = (page.prev_cursor, page.next_cursor) if isinstance(
+        page, SeekPage) else (page.page, page.pages)
+    return (rows, links), None
+
+
+def _post_validators(post_id: int) -> Optional[Tuple[Sequence, Optional[datetime]]]:
+    """ETag parts of a post page. No Last-Modified, for the same reasons as listings: the author's name and avatar
+    and the viewer's buttons change the page without touching the post's date_modified.
+    """
+    row = _post_listing_meta().filter(Post.id == post_id).first()
+    if row is None:
+        return None
+    return tuple(row), None
@@ -0,0 +1,175 @@
+import hashlib
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import flask
+
+# Token bucket of `capacity` tokens refilling at capacity / period per second, stored as a hash of
+# (tokens, ts). Takes a token if there is one and returns 0, otherwise the seconds until there is one.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local rate = capacity / period
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(period))
+return tostring(retry_after)
+"""
+
+
+class RateLimited(Exception):
+    """Raised when a request has no token left in one of its buckets. Answered with 429 (errors blueprint)."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def _take(state: Optional[Tuple[float, float]], capacity: int, period: float,
+          now: float) -> Tuple[Tuple[float, float], float]:
+    """TOKEN_BUCKET_SCRIPT in Python. Returns the new (tokens, ts) of the bucket and the seconds to wait (0 if a
+    token was taken).
+    """
+    rate = capacity / period
+    tokens, ts = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """Buckets of this process. With several app processes every process allows the full rate, use "shared"."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[Tuple[float, float], float]] = {}  # key -> (state, time it's full again)
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def take(self, key: str, capacity: int, period: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                # a full bucket is the same as no bucket, drop those so idle clients don't pile up
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[1] > now}
+                self._next_sweep = now + 60
+            bucket = self._buckets.get(key)
+            state, retry_after = _take(bucket[0] if bucket else None, capacity, period, now)
+            self._buckets[key] = (state, now + (capacity - state[0]) * period / capacity)
+            return retry_after
+
+
+class LocalScriptClient:
+    """Local stand-in for the shared server, implementing the `register_script` part of the redis-py client API for
+    TOKEN_BUCKET_SCRIPT only, so the shared code path can run in development and tests without a server.
+    """
+
+    def __init__(self):
+        self._backend = MemoryBackend()
+
+    def register_script(self, source: str):
+        assert source == TOKEN_BUCKET_SCRIPT, "only the token bucket script is stood in"
+
+        def script(keys, args):
+            capacity, period, _ = args  # the stand-in keeps its own (monotonic) clock
+            return str(self._backend.take(keys[0], int(capacity), float(period))).encode("ascii")
+        return script
+
+
+class SharedBackend:
+    """Buckets on a shared key-value server (anything speaking the redis-py client API), so the limits hold across
+    every app process. Each take is one atomic script call.
+    """
+
+    def __init__(self, client, prefix: str = "flaskblog:ratelimit:"):
+        self.prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, key: str, capacity: int, period: float) -> float:
+        # wall clock, so every process agrees on it
+        return float(self._script(keys=[self.prefix + key], args=[capacity, period, time.time()]))
+
+
+class RateLimitStats:
+    def __init__(self):
+        self.throttled: Dict[Tuple[str, str], int] = {}  # (endpoint, bucket kind) -> rejected requests
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, kind: str):
+        with self._lock:
+            self.throttled[(endpoint, kind)] = self.throttled.get((endpoint, kind), 0) + 1
+
+    def snapshot(self) -> Dict[Tuple[str, str], int]:
+        with self._lock:
+            return dict(self.throttled)
+
+
+# what this process rejected, read by flaskblog.metrics
+stats = RateLimitStats()
+
+
+def _make_backend(backend_type: str, shared_url: Optional[str]):
+    if backend_type == "memory":
+        return MemoryBackend()
+    if backend_type == "shared":
+        if shared_url is None or shared_url.startswith("local://"):
+            return SharedBackend(LocalScriptClient())
+        import redis  # optional dependency, only needed for a real shared server
+        return SharedBackend(redis.Redis.from_url(shared_url))
+    raise ValueError(f"Unknown rate limit backend {backend_type!r}")
+
+
+def _account_key(field: str) -> Optional[str]:
+    # straight off the submitted form, it isn't validated yet. Hashed, so no addresses end up in the shared server.
+    value = flask.request.form.get(field, "").strip().lower()
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:32] if value else None
+
+
+def _check_rate_limits():
+    """Takes a token from each bucket of the request (per client IP, per target account) for the endpoints in
+    RATELIMIT_ROUTES, before the view runs, so a throttled request costs neither form validation nor hashing.
+    """
+    request = flask.request
+    limits = flask.current_app.config["RATELIMIT_ROUTES"].get(request.endpoint)
+    if limits is None or request.method not in limits.get("methods", ("POST",)):
+        return
+    keys = {}
+    if "ip" in limits:
+        # the peer address: behind a reverse proxy, wrap the app in werkzeug's ProxyFix to get the client's
+        keys["ip"] = request.remote_addr or "unknown"
+    if "account" in limits:
+        account = _account_key(limits.get("account_field", "email"))
+        if account is not None:
+            keys["account"] = account
+
+    retry_after = 0.0
+    for kind, key in keys.items():
+        capacity, period = limits[kind]
+        wait = flask.current_app.extensions["ratelimit"].take(f"{request.endpoint}:{kind}:{key}", capacity, period)
+        if wait > 0:
+            stats.record(request.endpoint, kind)
+            retry_after = max(retry_after, wait)
+    if retry_after > 0:
+        raise RateLimited(retry_after)
+
+
+def init_app(app: flask.Flask):
+    app.config.setdefault("RATELIMIT_ENABLED", True)
+    app.config.setdefault("RATELIMIT_BACKEND", "memory")
+    app.config.setdefault("RATELIMIT_ROUTES", {})
+    app.config.setdefault("CACHE_SHARED_URL", None)
+    if not app.config["RATELIMIT_ENABLED"]:
+        return
+    app.extensions["ratelimit"] = _make_backend(app.config["RATELIMIT_BACKEND"], app.config["CACHE_SHARED_URL"])
+    app.before_request(_check_rate_limits)
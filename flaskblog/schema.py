@@ -0,0 +1,103 @@
+from typing import List
+
+import click
+import flask
+import flask.cli
+import sqlalchemy
+
+import flaskblog
+from flaskblog.models import Post
+from flaskblog.posts.utils import _reconcile_post_counters, _rerender_posts
+from flaskblog.search.utils import FTS_DDL, _rebuild_index
+
+# run once a column is added to an existing table, filling it in for the rows that were already there
+BACKFILLS = {
+    # modified no earlier than posted, also repairs rows given a placeholder date by a hand-run ALTER TABLE
+    ("post", "date_modified"): "UPDATE post SET date_modified = date_posted "
+                               "WHERE date_modified IS NULL OR date_modified < date_posted",
+}
+
+
+def _column_ddl(column: sqlalchemy.Column, dialect) -> str:
+    # sqlite can't add a NOT NULL column without a DEFAULT, those are added nullable and backfilled
+    if column.nullable or column.server_default is not None:
+        return str(sqlalchemy.schema.CreateColumn(column).compile(dialect=dialect))
+    return f"{column.name} {column.type.compile(dialect=dialect)}"
+
+
+def upgrade(batch_size: int = 1000) -> List[str]:
+    """Brings a database created by an older version of the app up to the current models: creates the missing
+    tables, columns and indexes, the search index with its triggers, then recounts the post counters and renders the
+    posts stored without HTML / excerpt. Every step is skipped when there's nothing to do, so it's safe to run on
+    every deploy.
+
+    Returns:
+        List[str]: what was done, one line per step.
+    """
+    db = flaskblog.db
+    engine = db.engine
+    done = []
+    existing = set(sqlalchemy.inspect(engine).get_table_names())
+    created = [table.name for table in db.metadata.sorted_tables if table.name not in existing]
+    # new tables come with their indexes, DDL listeners (the counter row, the search index) included
+    db.create_all()
+    if created:
+        done.append(f"Created tables {', '.join(created)}.")
+
+    inspector = sqlalchemy.inspect(engine)
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name in created:
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                conn.execute(sqlalchemy.text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(column, engine.dialect)}"))
+                done.append(f"Added column {table.name}.{column.name}.")
+                if (table.name, column.name) in BACKFILLS:
+                    conn.execute(sqlalchemy.text(BACKFILLS[table.name, column.name]))
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(bind=conn)
+                    done.append(f"Created index {index.name}.")
+
+    if engine.dialect.name == "sqlite" and Post.__table__.name not in created:
+        if "post_fts" in existing:
+            # recreates any trigger that went missing, the index itself is kept
+            with engine.begin() as conn:
+                for statement in FTS_DDL:
+                    conn.execute(sqlalchemy.text(statement))
+        else:
+            _rebuild_index()
+            done.append("Built the search index.")
+
+    drifted = _reconcile_post_counters()
+    if drifted:
+        flaskblog.cache.invalidate("feed")
+        done.append(f"Recounted post counters, {drifted} were off.")
+    rendered = _rerender_posts(batch_size)
+    if rendered:
+        done.append(f"Rendered {rendered} posts.")
+    return done
+
+
+def init_app(app: flask.Flask):
+    app.cli.add_command(db_cli)
+
+
+db_cli = flask.cli.AppGroup("db", help="Database schema.")
+
+
+@db_cli.command("upgrade")
+@click.option("--batch-size", type=int, default=1000, show_default=True, help="Posts rendered per transaction.")
+def upgrade_command(batch_size: int):
+    """Creates what's missing from the database (tables, columns, indexes, the search index) and fills in the
+    columns and counters derived from the posts. Run it after every update of the app.
+    """
+    done = upgrade(batch_size)
+    for line in done:
+        click.echo(line)
+    click.echo("The database is up to date." if done else "The database was already up to date.")
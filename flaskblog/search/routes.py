@@ -0,0 +1,26 @@
+import click
+import flask
+
+from flaskblog import streaming
+from flaskblog.database import read_replica
+from flaskblog.search.utils import _rebuild_index, _search_posts
+from flaskblog.sqlstats import query_budget
+
+search = flask.Blueprint("search", __name__)
+
+
+@search.route("/search")
+@read_replica
+@query_budget(2)  # results with their authors + session user
+def search_posts() -> str:
+    q = flask.request.args.get("q", "")
+    results, next_cursor = _search_posts(q, after=flask.request.args.get("after"),
+                                         per_page=flask.current_app.config["POSTS_PER_PAGE"])
+    return streaming.render_template("search.html", title="Search", q=q, results=results, next_cursor=next_cursor)
+
+
+@search.cli.command("rebuild")
+def rebuild_command():
+    """Builds the full-text index over all existing posts (run once on databases created before search existed)."""
+    _rebuild_index()
+    click.echo("Search index rebuilt.")
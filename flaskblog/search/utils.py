@@ -0,0 +1,135 @@
+import base64
+import binascii
+import re
+from typing import List, Optional, Tuple
+
+import flask
+import markupsafe
+import sqlalchemy
+
+import flaskblog
+from flaskblog.models import Post
+
+# External content FTS5 index over post.title and post.content: the index stores only the tokens, the text itself
+# is read back from the post table. The triggers keep it in step with post inside the writing transaction, so
+# new_post, update_post and delete_post (or anything else writing posts) can't leave it stale.
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(
+        title, content, content='post', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_ai AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_ad AFTER DELETE ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_au AFTER UPDATE OF title, content ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+for _statement in FTS_DDL:
+    sqlalchemy.event.listen(Post.__table__, "after_create",
+                            sqlalchemy.DDL(_statement).execute_if(dialect="sqlite"))
+
+# title matches weigh more than content matches
+_RANK = "bm25(post_fts, 10.0, 1.0)"
+
+_SEARCH_SQL = """
+WITH page AS (
+    SELECT id, rank FROM (
+        SELECT rowid AS id, {rank} AS rank FROM post_fts WHERE post_fts MATCH :query
+    ) {after} ORDER BY rank, id LIMIT :limit
+)
+SELECT page.id, page.rank, post.date_posted, user.username, user.image_file,
+       highlight(post_fts, 0, char(2), char(3)) AS title,
+       snippet(post_fts, 1, char(2), char(3), '…', 32) AS snippet
+FROM page
+JOIN post_fts ON post_fts.rowid = page.id
+JOIN post ON post.id = page.id
+JOIN user ON user.id = post.user_id
+WHERE post_fts MATCH :query
+ORDER BY page.rank, page.id
+"""
+
+
+def _rebuild_index():
+    """Creates the index and its triggers if they're missing and reindexes every post."""
+    with flaskblog.db.engine.begin() as conn:
+        for statement in FTS_DDL:
+            conn.execute(sqlalchemy.text(statement))
+        conn.execute(sqlalchemy.text(
+            "INSERT INTO post_fts(post_fts) VALUES ('rebuild')"))
+        conn.execute(sqlalchemy.text(
+            "INSERT INTO post_fts(post_fts) VALUES ('optimize')"))
+
+
+def _match_query(text: str) -> Optional[str]:
+    """Turns free text from the search box into an FTS5 query matching posts with all of its words. Every word is
+    quoted so FTS5 operators and syntax in the input are taken literally.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+def _highlight(text: str) -> markupsafe.Markup:
+    # escape the post text first, then turn the match markers into tags
+    return markupsafe.escape(text).replace("\x02", markupsafe.Markup("<mark>")).replace(
+        "\x03", markupsafe.Markup("</mark>"))
+
+
+def _encode_cursor(rank: float, post_id: int) -> str:
+    raw = f"{rank!r}|{post_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        rank, post_id = raw.split("|")
+        return float(rank), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        flask.abort(400)
+
+
+class SearchResult:
+    def __init__(self, row):
+        self.id = row.id
+        self.rank = row.rank
+        self.date_posted = row.date_posted
+        self.username = row.username
+        self.image_file = row.image_file
+        self.title = _highlight(row.title)
+        self.snippet = _highlight(row.snippet)
+
+
+def _search_posts(text: str, after: Optional[str] = None, per_page: int = 5) -> Tuple[List[SearchResult], Optional[str]]:
+    """Best matches first (bm25), paginated by a (rank, id) cursor like the post listings.
+
+    Args:
+        text (str): what the user typed into the search box.
+        after (str, optional): cursor of the last result of the previous page.
+        per_page (int, optional): results per page. Defaults to 5.
+
+    Returns:
+        tuple: the page's results and the cursor of the next page (None on the last page).
+    """
+    query = _match_query(text)
+    if query is None:
+        return [], None
+
+    params = {"query": query, "limit": per_page + 1}
+    where_after = ""
+    if after:
+        params["rank"], params["id"] = _decode_cursor(after)
+        where_after = "WHERE (rank, id) > (:rank, :id)"
+    sql = _SEARCH_SQL.format(rank=_RANK, after=where_after)
+    rows = flaskblog.db.session.execute(sqlalchemy.text(sql).columns(
+        date_posted=flaskblog.db.DateTime), params).all()
+
+    results = [SearchResult(row) for row in rows[:per_page]]
+    next_cursor = _encode_cursor(
+        results[-1].rank, results[-1].id) if len(rows) > per_page else None
+    return results, next_cursor
@@ -0,0 +1,85 @@
+import functools
+import time
+from typing import Callable, Iterable, Iterator
+
+import flask
+import sqlalchemy
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a view issues more SQL statements than its budget allows, e.g. after an N+1 regression."""
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if flask.has_app_context():
+        flask.g.sql_statements = flask.g.get("sql_statements", 0) + 1
+    context._flaskblog_start = time.perf_counter()
+
+
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    if not flask.has_app_context():
+        return
+    elapsed = time.perf_counter() - context._flaskblog_start
+    flask.g.sql_seconds = flask.g.get("sql_seconds", 0.0) + elapsed
+    threshold = flask.current_app.config["SQL_SLOW_QUERY_THRESHOLD"]
+    if threshold is not None and elapsed >= threshold:
+        flask.current_app.logger.warning(
+            f"Slow query ({elapsed * 1000:.1f} ms): {' '.join(statement.split())[:500]}")
+
+
+def statement_count() -> int:
+    """Number of SQL statements issued so far in the current app context (i.e. request)."""
+    return flask.g.get("sql_statements", 0)
+
+
+def statement_seconds() -> float:
+    """Time spent executing those statements, in seconds."""
+    return flask.g.get("sql_seconds", 0.0)
+
+
+def init_app(app: flask.Flask):
+    # Flask-SQLAlchemy creates its engines lazily, so listen on the Engine class rather than an instance.
+    for event, listener in [("before_cursor_execute", _count_statement), ("after_cursor_execute", _time_statement)]:
+        if not sqlalchemy.event.contains(Engine, event, listener):
+            sqlalchemy.event.listen(Engine, event, listener)
+    app.config.setdefault("SQL_QUERY_BUDGET_ENFORCED", False)
+    app.config.setdefault("SQL_SLOW_QUERY_THRESHOLD", 0.1)  # seconds, None turns the log off
+
+
+def _check_budget(issued: int, max_statements: int):
+    if issued > max_statements:
+        message = f"{flask.request.endpoint} issued {issued} SQL statements, budget is {max_statements}"
+        if flask.current_app.config["SQL_QUERY_BUDGET_ENFORCED"]:
+            raise QueryBudgetExceeded(message)
+        flask.current_app.logger.warning(message)
+
+
+def _checked_stream(chunks: Iterable, start: int, max_statements: int) -> Iterator:
+    yield from chunks
+    _check_budget(statement_count() - start, max_statements)
+
+
+def query_budget(max_statements: int) -> Callable:
+    """Holds a view to at most `max_statements` SQL statements, including the ones lazily issued while rendering
+    its template. With SQL_QUERY_BUDGET_ENFORCED (TestConfig) going over budget raises QueryBudgetExceeded,
+    otherwise it is logged as a warning.
+
+    Args:
+        max_statements (int): statements the view may issue.
+    """
+    def decorator(view: Callable) -> Callable:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # an app context can outlive a single request (e.g. in tests), so only count our own statements
+            start = statement_count()
+            response = view(*args, **kwargs)
+            if isinstance(response, flask.Response) and response.is_streamed:
+                # a streamed template (flaskblog.streaming) renders after the view returns, count until it's sent
+                response.response = flask.stream_with_context(
+                    _checked_stream(response.response, start, max_statements))
+                return response
+            _check_budget(statement_count() - start, max_statements)
+            return response
+        return wrapper
+    return decorator
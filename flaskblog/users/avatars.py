@@ -0,0 +1,130 @@
+import concurrent.futures
+import hashlib
+import io
+import os
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Set
+
+import flask
+
+AVATAR_DIR = "static/profile_pics"
+DEFAULT_AVATAR = "default.jpg"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app: flask.Flask) -> concurrent.futures.Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = app.config["AVATAR_WORKERS"]
+            if app.config["AVATAR_EXECUTOR"] == "process":
+                _executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers)
+            else:
+                # PIL releases the GIL while decoding / resizing, so threads scale too
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="avatars")
+        return _executor
+
+
+def _variant(filename: str, size: int, canonical_size: int) -> str:
+    """File name of the `size` px variant of the avatar stored as `filename`. Avatars from before the pipeline (and
+    the default one) only exist in one size.
+    """
+    stem, ext = os.path.splitext(filename)
+    if ext != ".webp" or size == canonical_size:
+        return filename
+    return f"{stem}-{size}{ext}"
+
+
+def _render(data: bytes, directory: str, digest: str, sizes: List[int], quality: int):
+    """Writes every size of an avatar as WebP. Runs in the executor, so it only takes picklable arguments."""
+    import PIL.Image  # imported on the first upload, in the executor, not by every worker at startup
+    image = PIL.Image.open(io.BytesIO(data))
+    image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    for size in sizes:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        path = os.path.join(directory, _variant(
+            f"{digest}.webp", size, sizes[0]))
+        # write next to the target and rename, so a half written file is never served
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        thumbnail.save(tmp_path, "WEBP", quality=quality)
+        os.replace(tmp_path, path)
+
+
+def _finish(future: concurrent.futures.Future, app: flask.Flask, on_ready: Callable[[str], None], filename: str):
+    if future.exception() is not None:
+        # nothing points at the missing files, the user keeps their previous avatar
+        app.logger.error("Avatar processing failed",
+                         exc_info=future.exception())
+        return
+    with app.app_context():
+        try:
+            on_ready(filename)
+        except Exception:
+            app.logger.exception("Storing the processed avatar failed")
+
+
+def _queue_avatar(form_picture, on_ready: Callable[[str], None]) -> Optional[str]:
+    """Queues the resizing / encoding of all sizes of an uploaded picture (validated by UpdateAccountForm).
+
+    Files are named after a hash of the upload, so a picture that is uploaded again (by anyone) is stored once and
+    needs no work at all.
+
+    Args:
+        form_picture (FileStorage): the uploaded picture.
+        on_ready (callable): gets the image_file to store on the user once every size is written. Called in an app
+            context of its own, from the executor, and only if processing succeeded.
+
+    Returns:
+        str: the image_file to store on the user right away when all its sizes exist already, None when the
+            picture was queued (and on_ready will store it).
+    """
+    app = flask.current_app._get_current_object()  # type: ignore
+    data = form_picture.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    filename = f"{digest}.webp"
+    directory = os.path.join(app.root_path, AVATAR_DIR)
+    sizes = list(app.config["AVATAR_SIZES"])
+    if all(os.path.exists(os.path.join(directory, _variant(filename, size, sizes[0]))) for size in sizes):
+        return filename
+    future = _get_executor(app).submit(_render, data, directory, digest, sizes,
+                                       app.config["AVATAR_QUALITY"])
+    future.add_done_callback(lambda f: _finish(f, app, on_ready, filename))
+    return None
+
+
+def _referenced_files(image_files: Iterable[str], sizes: List[int]) -> Set[str]:
+    referenced = {DEFAULT_AVATAR}
+    for image_file in image_files:
+        referenced.update(_variant(image_file, size, sizes[0])
+                          for size in sizes)
+    return referenced
+
+
+def _collect_garbage(image_files: Iterable[str], dry_run: bool = False, grace_seconds: int = 3600) -> List[str]:
+    """Deletes avatar files no user references any more.
+
+    Args:
+        image_files (iterable): image_file of every user.
+        dry_run (bool, optional): only report what would be deleted. Defaults to False.
+        grace_seconds (int, optional): files younger than this are kept, as their upload may not be committed yet.
+
+    Returns:
+        list: names of the deleted files.
+    """
+    app = flask.current_app
+    directory = os.path.join(app.root_path, AVATAR_DIR)
+    referenced = _referenced_files(image_files, list(app.config["AVATAR_SIZES"]))
+    cutoff = time.time() - grace_seconds
+    deleted = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name not in referenced and entry.stat().st_mtime < cutoff:
+            if not dry_run:
+                os.remove(entry.path)
+            deleted.append(entry.name)
+    return deleted
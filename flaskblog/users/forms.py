@@ -85,6 +85,18 @@ class UpdateAccountForm(FlaskForm):
                 raise ValidationError(
                     "The email is taken. Please choose another email")
 
+    def validate_picture(self, picture: FileField):
+        """
+        Checks the upload is an image PIL can read, without decoding its pixels. Resizing happens off the request.
+        """
+        if picture.data:
+            import PIL.Image  # heavy, only needed when a picture is uploaded
+            try:
+                PIL.Image.open(picture.data).verify()
+            except Exception:
+                raise ValidationError("That file is not a valid image")
+            picture.data.seek(0)
+
 
 class RequestResetForm(FlaskForm):
     email = StringField("Email", validators=[
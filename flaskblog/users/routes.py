@@ -1,12 +1,20 @@
 from typing import Union
+import click
 import flask
 import flask_login
 from werkzeug.wrappers.response import Response
 import flaskblog
-from flaskblog.models import Post, User
-
+from flaskblog import streaming
+from flaskblog.models import Post, User, forget_session_user
+from flaskblog.conditional import conditional
+from flaskblog.database import read_replica
+from flaskblog.hashing import HashingBusy
+from flaskblog.posts.utils import _paginate_posts, _post_listing
+from flaskblog.sqlstats import query_budget
+
+from flaskblog.users.avatars import _collect_garbage, _variant
 from flaskblog.users.forms import LoginForm, RegistrationForm, RequestResetForm, ResetPasswordForm, UpdateAccountForm
-from flaskblog.users.utils import _save_picture, _send_reset_email
+from flaskblog.users.utils import _invalidate_author_pages, _save_picture, _send_reset_email, _user_posts_validators
 
 users = flask.Blueprint("users", __name__)
 
@@ -20,8 +28,8 @@ def register() -> Union[str, Response]:
     form = RegistrationForm()
     # after POST
     if form.validate_on_submit():
-        hashed_pass = flaskblog.bcrypt.generate_password_hash(
-            form.password.data).decode("utf-8")
+        hashed_pass = flaskblog.passwords.generate_password_hash(
+            form.password.data)
         user = User(username=form.username.data,
                     email=form.email.data, password=hashed_pass)
         flaskblog.db.session.add(user)
@@ -47,7 +55,15 @@ def login() -> Union[str, Response]:
     if form.validate_on_submit():
         # rather than handling authentication on form validators - we use login_manager to maintain session.
         user = User.query.filter_by(email=form.email.data).first()
-        if user and flaskblog.bcrypt.check_password_hash(user.password, form.password.data):
+        if user and flaskblog.passwords.check_password_hash(user.password, form.password.data):
+            if flaskblog.passwords.needs_rehash(user.password):
+                # BCRYPT_LOG_ROUNDS changed since the hash was made, upgrade it while we know the password
+                try:
+                    user.password = flaskblog.passwords.generate_password_hash(
+                        form.password.data)
+                    flaskblog.db.session.commit()
+                except HashingBusy:
+                    pass  # the password checked out, log in anyway and upgrade on a later login
             flask_login.login_user(user, remember=form.remember.data)
             # can redirect to login from authentication screened pages. That way we have a next query param from the url.
             next_page = flask.request.args.get("next")
@@ -71,13 +87,23 @@ def account() -> Union[str, Response]:
     form = UpdateAccountForm()
 
     if form.validate_on_submit():
+        # current_user is a cached snapshot, changes go to the row
+        user: User = User.query.get(flask_login.current_user.id)  # type: ignore
+        old_username, old_image_file = user.username, user.image_file
         if form.picture.data:
-            pic_filename = _save_picture(form.picture.data)
-            flask_login.current_user.image_file = pic_filename
-
-        flask_login.current_user.username = form.username.data
-        flask_login.current_user.email = form.email.data
+            pic_filename = _save_picture(form.picture.data, user.id)
+            if pic_filename is not None:
+                user.image_file = pic_filename
+            else:
+                # the user keeps their current avatar until every size of the new one is written
+                flask.flash("Your new picture will show up in a moment.", "info")
+
+        user.username = form.username.data
+        user.email = form.email.data
         flaskblog.db.session.commit()
+        forget_session_user(user.id)
+        if (old_username, old_image_file) != (user.username, user.image_file):
+            _invalidate_author_pages(user, old_username)
         flask.flash("Your account has been updated!", "success")
         # redirect for post-get-redirect pattern.
         # runs GET instead of POST, to avoid resubmit notification when page is reloaded
@@ -92,12 +118,15 @@ def account() -> Union[str, Response]:
 
 
 @users.route("/user/<string:username>")
+@read_replica
+@flaskblog.cache.cached(lambda username: [f"user:{username}"])
+@conditional(_user_posts_validators)
+@query_budget(3)  # user (with their post_count) + posts + session user
 def user_posts(username: str) -> str:
-    page = flask.request.args.get("page", 1, type=int)
     user = User.query.filter_by(username=username).first_or_404()
-    posts = Post.query.filter_by(author=user).order_by(
-        Post.date_posted.desc()).paginate(page=page, per_page=5)
-    return flask.render_template("user_posts.html", posts=posts, user=user)
+    posts = _paginate_posts(_post_listing().filter(
+        Post.user_id == user.id), lambda: user.post_count)
+    return streaming.render_template("user_posts.html", posts=posts, user=user, total=user.post_count)
 
 
 @users.route("/reset_password", methods=["GET", "POST"])
@@ -112,6 +141,7 @@ def reset_request() -> Union[str, Response]:
         user: User = User.query.filter_by(email=form.email.data).first()
         # send the user an email with the token with which they can reset their password
         _send_reset_email(user)
+        flaskblog.db.session.commit()
         flask.flash(
             "An email has been sent with instructions to reset your password", "info")
         return flask.redirect(flask.url_for("users.login"))
@@ -136,11 +166,31 @@ def reset_token(token) -> Union[str, Response]:
 
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        hashed_password = flaskblog.bcrypt.generate_password_hash(
+        hashed_password = flaskblog.passwords.generate_password_hash(
             form.password.data)
         user.password = hashed_password  # update
         flaskblog.db.session.commit()
+        forget_session_user(user.id)
         flask.flash("Your password has been updated!", "success")
         return flask.redirect(flask.url_for("main.home"))
 
     return flask.render_template("reset_token.html", title="Reset Password", form=form)
+
+
+@users.app_template_filter("avatar")
+def avatar_filter(image_file: str, size: int) -> str:
+    """`size` px variant of an avatar, e.g. {{ post.author.image_file|avatar(64) }}."""
+    return _variant(image_file, size, flask.current_app.config["AVATAR_SIZES"][0])
+
+
+@users.cli.command("gc-avatars")
+@click.option("--dry-run", is_flag=True, help="Only list the files that would be deleted.")
+def gc_avatars_command(dry_run: bool):
+    """Deletes avatar files that no user references any more."""
+    image_files = [image_file for image_file,
+                   in flaskblog.db.session.query(User.image_file)]
+    deleted = _collect_garbage(image_files, dry_run=dry_run)
+    for name in deleted:
+        click.echo(name)
+    click.echo(
+        f"{'Would delete' if dry_run else 'Deleted'} {len(deleted)} files.")
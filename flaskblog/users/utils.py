@@ -1,34 +1,58 @@
-import os
 import flask
-import flask_mail
-import secrets
-import PIL.Image
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
 
 import flaskblog
-from flaskblog.models import User
+from flaskblog import outbox
+from flaskblog.models import Post, User, forget_session_user
+from flaskblog.posts.utils import _listing_validators, _post_listing_meta
+from flaskblog.users.avatars import _queue_avatar
 
 
-def _save_picture(form_picture) -> str:
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_filename: str = random_hex + f_ext
-    pic_path = os.path.join(flask.current_app.root_path,
-                            "static/profile_pics", picture_filename)
-    output_size = (125, 125)
-    image = PIL.Image.open(form_picture)
-    image.thumbnail(output_size)
-    image.save(pic_path)
-    return picture_filename
+def _save_picture(form_picture, user_id: int) -> Optional[str]:
+    # only queues the work: decoding, resizing and encoding run on the avatar executor, see users.avatars
+    return _queue_avatar(form_picture, lambda image_file: _set_avatar(user_id, image_file))
+
+
+def _set_avatar(user_id: int, image_file: str):
+    """Points the user at their new avatar, once all its files are written."""
+    user = User.query.get(user_id)
+    if user is None:
+        return  # deleted in the meantime
+    user.image_file = image_file
+    flaskblog.db.session.commit()
+    forget_session_user(user_id)
+    _invalidate_author_pages(user, user.username)
 
 
 def _send_reset_email(user: User):
     token = user.get_reset_token()
-    msg = flask_mail.Message(subject="Password Reset Request",
-                             sender="noreply@demo.com", recipients=[user.email])
-    msg.body = f"""To reset your password, visit the following link:
+    body = f"""To reset your password, visit the following link:
 {flask.url_for("users.reset_token", token=token, _external=True)}
 
 If you did not make this request then simply ignore this email and no change wil be made"""
     # _external=True is used to get absolute url rather than relative url.
     # complex email bodies can be rendered with jinja2 templates.
-    flaskblog.mail.send(msg)
+    # queued rather than sent here: the outbox worker delivers it, so SMTP can't slow down or fail the request
+    outbox.enqueue(subject="Password Reset Request", sender="noreply@demo.com", recipients=[user.email],
+                   body=body)
+
+
+def _invalidate_author_pages(user: User, old_username: str):
+    """Username and avatar are rendered next to every post of the user, so every cached page with one of their
+    posts goes: the feed, their posts list (under the old and new username) and each of their post pages.
+    """
+    post_ids = flaskblog.db.session.query(Post.id).filter_by(user_id=user.id)
+    flaskblog.cache.invalidate("feed", f"user:{old_username}", f"user:{user.username}",
+                               *(f"post:{post_id}" for post_id, in post_ids))
+
+
+def _user_posts_validators(username: str) -> Optional[Tuple[Sequence, Optional[datetime]]]:
+    post_count = flaskblog.db.session.query(
+        User.post_count).filter_by(username=username).scalar()
+    if post_count is None:
+        return None  # no such user, the view 404s
+    parts, last_modified = _listing_validators(
+        _post_listing_meta().filter(User.username == username), lambda: post_count)
+    # the page heading shows how many posts the user has
+    return (parts, post_count), last_modified
@@ -0,0 +1,67 @@
+"""App and data shared by the tests: TestConfig on in-memory sqlite, seeded with AUTHORS authors taking turns at
+writing POSTS_PER_AUTHOR posts each, one hour apart. Post n (from 0) has id n + 1 and is by author{n % AUTHORS},
+every author's password is PASSWORD.
+
+    python -m pytest tests
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import flaskblog
+from flaskblog.config import TestConfig
+from flaskblog.models import Post, User
+from flaskblog.posts.utils import _reconcile_post_counters
+
+AUTHORS = 4
+POSTS_PER_AUTHOR = 6
+PASSWORD = "password"
+
+
+class BlogTestConfig(TestConfig):
+    CACHE_TYPE = "null"  # every request runs its view
+    USER_CACHE_TYPE = "null"  # and loads the session user
+
+
+@pytest.fixture
+def app_config():
+    """Config class of the app, override it in a test module to change settings."""
+    return BlogTestConfig
+
+
+@pytest.fixture
+def app(app_config):
+    app = flaskblog.create_app(app_config)
+    with app.app_context():
+        flaskblog.db.create_all()
+        password = flaskblog.passwords.generate_password_hash(PASSWORD)
+        authors = [User(username=f"author{i}", email=f"author{i}@example.com", password=password)
+                   for i in range(AUTHORS)]
+        flaskblog.db.session.add_all(authors)
+        flaskblog.db.session.flush()
+        start = datetime(2021, 1, 1)
+        # authors take turns, so every page lists posts of several of them
+        for n in range(AUTHORS * POSTS_PER_AUTHOR):
+            flaskblog.db.session.add(Post(title=f"Post {n}", content=f"Content of post {n}", excerpt=f"Post {n}",
+                                          word_count=4, user_id=authors[n % AUTHORS].id,
+                                          date_posted=start + timedelta(hours=n)))
+        flaskblog.db.session.commit()
+        _reconcile_post_counters()
+    yield app
+    with app.app_context():
+        flaskblog.db.session.remove()
+        flaskblog.db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Logs the test client in as the given author."""
+    def login(username: str):
+        response = client.post("/login", data={"email": f"{username}@example.com", "password": PASSWORD})
+        assert response.status_code == 302
+    return login
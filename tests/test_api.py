@@ -0,0 +1,53 @@
+"""Keyset-paginated collections of the JSON API (flaskblog.api)."""
+import pytest
+
+from conftest import AUTHORS, POSTS_PER_AUTHOR
+
+
+def _walk(client, path: str) -> list:
+    """Every item of a collection, following its "next" cursors from `path` on."""
+    items = []
+    base = path.split("?")[0]
+    while path:
+        page = client.get(path).get_json()
+        items.extend(page["items"])
+        path = page["next"] and f"{base}?limit=3&after={page['next']}"
+    return items
+
+
+def test_users_in_id_order_with_cursors(client):
+    first = client.get("/api/v1/users?limit=3").get_json()
+    assert [user["username"] for user in first["items"]] == ["author0", "author1", "author2"]
+    assert first["prev"] is None
+    assert first["items"][0] == {"id": 1, "username": "author0", "image_file": "default.jpg",
+                                 "post_count": POSTS_PER_AUTHOR}
+
+    second = client.get(f"/api/v1/users?limit=3&after={first['next']}").get_json()
+    assert [user["username"] for user in second["items"]] == ["author3"]
+    assert second["next"] is None
+    back = client.get(f"/api/v1/users?limit=3&before={second['prev']}").get_json()
+    assert back["items"] == first["items"]
+    assert back["prev"] is None
+
+
+def test_users_walk(client):
+    forward = _walk(client, "/api/v1/users?limit=3")
+    assert [user["id"] for user in forward] == list(range(1, AUTHORS + 1))
+
+
+def test_users_fields(client):
+    page = client.get("/api/v1/users?fields=username").get_json()
+    assert page["items"][0] == {"username": "author0"}
+    assert client.get("/api/v1/users?fields=password").status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "%%%"])
+def test_users_bad_cursor(client, cursor):
+    response = client.get(f"/api/v1/users?after={cursor}")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Bad Request"
+
+
+def test_posts_walk_newest_first(client):
+    posts = _walk(client, "/api/v1/posts?limit=3&fields=id,title")
+    assert [post["id"] for post in posts] == list(range(AUTHORS * POSTS_PER_AUTHOR, 0, -1))
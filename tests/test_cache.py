@@ -0,0 +1,123 @@
+"""Rendered page cache of anonymous visitors (flaskblog.cache.ResponseCache), on both of its backends."""
+import pytest
+
+import flaskblog
+from conftest import BlogTestConfig
+
+
+class CachedConfig(BlogTestConfig):
+    CACHE_TYPE = "lru"
+
+
+class SharedCachedConfig(BlogTestConfig):
+    CACHE_TYPE = "shared"  # without CACHE_SHARED_URL: the in-process stand-in of the server
+
+
+class StreamedCachedConfig(CachedConfig):
+    STREAMING_VIEWS = ("main.home",)
+    STREAMING_BUFFER = 2
+
+
+@pytest.fixture(params=[CachedConfig, SharedCachedConfig], ids=["lru", "shared"])
+def app_config(request):
+    return request.param
+
+
+def _assert_miss_then_hit(client, path: str) -> bytes:
+    miss = client.get(path)
+    assert miss.status_code == 200
+    assert miss.headers["X-Cache"] == "MISS"
+    hit = client.get(path)
+    assert hit.headers["X-Cache"] == "HIT"
+    assert hit.data == miss.data
+    return hit.data
+
+
+@pytest.mark.parametrize("path", ["/home", "/home?page=2", "/post/3", "/user/author1", "/feed.atom"])
+def test_second_view_is_a_hit(client, path):
+    _assert_miss_then_hit(client, path)
+
+
+def test_hit_answers_conditional_get(client):
+    etag = client.get("/post/3").headers["ETag"]
+    response = client.get("/post/3", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["X-Cache"] == "HIT"
+
+
+def test_post_edit_invalidates_its_pages(client, login):
+    # post 21 is on the first page, by author0
+    paths = ["/home", "/post/21", "/user/author0", "/feed.atom"]
+    for path in paths:
+        _assert_miss_then_hit(client, path)
+    login("author0")
+    client.post("/post/21/update", data={"title": "Edited title", "content": "Edited content"}, follow_redirects=True)
+    client.get("/logout")
+    for path in paths:
+        assert b"Edited title" in _assert_miss_then_hit(client, path)
+
+
+def test_post_delete_invalidates_its_pages(client, login):
+    paths = ["/home", "/user/author3", "/feed.atom"]
+    for path in paths + ["/post/24"]:
+        _assert_miss_then_hit(client, path)
+    login("author3")
+    client.post("/post/24/delete", follow_redirects=True)
+    client.get("/logout")
+    assert client.get("/post/24").status_code == 404
+    for path in paths:
+        assert b"Post 23" not in _assert_miss_then_hit(client, path)
+
+
+def test_author_rename_invalidates_their_pages(client, login):
+    # post 2 is by author1
+    paths = ["/home", "/post/2", "/feed.atom"]
+    for path in paths + ["/user/author1"]:
+        _assert_miss_then_hit(client, path)
+    login("author1")
+    client.post("/account", data={"username": "renamed", "email": "author1@example.com"}, follow_redirects=True)
+    client.get("/logout")
+    for path in paths:
+        assert b"renamed" in _assert_miss_then_hit(client, path)
+    assert b"renamed" in _assert_miss_then_hit(client, "/user/renamed")
+
+
+def test_logged_in_pages_are_not_cached(client, login):
+    login("author0")
+    for _ in range(2):
+        response = client.get("/home")
+        assert response.status_code == 200
+        assert "X-Cache" not in response.headers
+    client.get("/logout")
+    # nor stored for anonymous visitors
+    assert client.get("/home").headers["X-Cache"] == "MISS"
+
+
+def test_invalidation_only_drops_its_tags(app, client):
+    _assert_miss_then_hit(client, "/post/3")
+    _assert_miss_then_hit(client, "/post/4")
+    with app.app_context():
+        flaskblog.cache.invalidate("post:3")
+        assert flaskblog.cache.backend.counter("gen:post:3") == 1
+        assert flaskblog.cache.backend.counter("gen:post:4") == 0
+    assert client.get("/post/3").headers["X-Cache"] == "MISS"
+    assert client.get("/post/4").headers["X-Cache"] == "HIT"
+
+
+@pytest.mark.parametrize("app_config", [StreamedCachedConfig])
+def test_streamed_page_is_stored_once_sent(client):
+    miss = client.get("/home")
+    assert miss.is_streamed
+    assert miss.headers["X-Cache"] == "MISS"
+    body = miss.get_data()  # all of it sent
+    hit = client.get("/home")
+    assert hit.headers["X-Cache"] == "HIT"
+    assert hit.data == body
+
+
+@pytest.mark.parametrize("app_config", [StreamedCachedConfig])
+def test_streamed_page_cut_short_is_not_stored(client):
+    response = client.get("/home", buffered=False)
+    next(iter(response.response))
+    response.close()  # the client went away after the first chunk
+    assert client.get("/home").headers["X-Cache"] == "MISS"
@@ -0,0 +1,49 @@
+"""Conditional GETs of the post pages and listings (flaskblog.conditional)."""
+import pytest
+
+
+# what a client sends that revalidates by date only, far in the future so any Last-Modified would match
+IF_MODIFIED_SINCE = {"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+
+
+@pytest.mark.parametrize("path", ["/home", "/user/author3"])
+def test_listing_revalidates_by_etag_only(client, path):
+    response = client.get(path)
+    assert response.last_modified is None
+    assert client.get(path, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_deleted_post_changes_listing(client, login):
+    etag = client.get("/home").headers["ETag"]
+    login("author3")
+    assert client.post("/post/24/delete").status_code == 302  # the newest one
+    client.get("/logout")
+    # a client holding the page from before the delete gets the new one
+    assert client.get("/home", headers={"If-None-Match": etag, **IF_MODIFIED_SINCE}).status_code == 200
+    assert client.get("/home", headers=IF_MODIFIED_SINCE).status_code == 200
+
+
+
+def test_post_revalidates_by_etag_only(client):
+    response = client.get("/post/1")
+    assert response.last_modified is None
+    assert client.get("/post/1", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_renamed_author_changes_post(client, login):
+    client.get("/post/1")
+    login("author0")
+    assert client.post("/account", data={"username": "renamed", "email": "author0@example.com"},
+                       follow_redirects=True).status_code == 200  # and shows the flash, pending ones skip the 304s
+    client.get("/logout")
+    response = client.get("/post/1", headers=IF_MODIFIED_SINCE)
+    assert response.status_code == 200
+    assert b"renamed" in response.data
+
+
+def test_login_changes_post(client, login):
+    assert b"Update" not in client.get("/post/1").data
+    login("author0")
+    response = client.get("/post/1", headers=IF_MODIFIED_SINCE)
+    assert response.status_code == 200
+    assert b"Update" in response.data
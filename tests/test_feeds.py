@@ -0,0 +1,33 @@
+"""Revalidation of the Atom / RSS feeds (flaskblog.feeds)."""
+import pytest
+
+IF_MODIFIED_SINCE = {"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+
+
+@pytest.mark.parametrize("path", ["/feed.atom", "/feed.rss", "/user/author1/feed.atom"])
+def test_feed_revalidates_by_etag_only(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.last_modified is None
+    assert client.get(path, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_deleted_older_entry_changes_feed(client, login):
+    etag = client.get("/feed.atom").headers["ETag"]
+    login("author1")
+    assert client.post("/post/22/delete", follow_redirects=True).status_code == 200  # not the newest one
+    client.get("/logout")
+    for headers in [{"If-None-Match": etag}, IF_MODIFIED_SINCE]:
+        response = client.get("/feed.atom", headers=headers)
+        assert response.status_code == 200
+        assert b"/post/22<" not in response.data
+
+
+def test_renamed_author_changes_feed(client, login):
+    client.get("/feed.atom")
+    login("author3")
+    client.post("/account", data={"username": "renamed", "email": "author3@example.com"}, follow_redirects=True)
+    client.get("/logout")
+    response = client.get("/feed.atom", headers=IF_MODIFIED_SINCE)
+    assert response.status_code == 200
+    assert b"<name>renamed</name>" in response.data
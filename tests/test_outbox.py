@@ -0,0 +1,116 @@
+"""Password reset emails through the outbox (flaskblog.outbox): enqueued by the request, delivered by drain(), retried
+with backoff and dead-lettered. flask_mail doesn't talk to a server in testing mode, it records what would be sent.
+"""
+import smtplib
+from datetime import datetime, timedelta
+
+import flask_mail
+import pytest
+
+import flaskblog
+from flaskblog import metrics, outbox
+from flaskblog.models import OutboxMessage
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+def _queued_count() -> int:
+    return next((int(line.split()[-1]) for line in metrics.OUTBOX_QUEUED_SECONDS.samples() if "_count" in line), 0)
+
+
+def _refuse(monkeypatch):
+    def send(connection, message, envelope_from=None):
+        raise smtplib.SMTPRecipientsRefused({message.recipients[0]: (550, b"No such user")})
+    monkeypatch.setattr(flask_mail.Connection, "send", send)
+
+
+def _make_due(message: OutboxMessage):
+    message.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    flaskblog.db.session.commit()
+
+
+def test_reset_request_only_enqueues(app, client):
+    with flaskblog.mail.record_messages() as sent:
+        response = client.post("/reset_password", data={"email": "author0@example.com"})
+    assert response.status_code == 302
+    assert sent == []
+    with app.app_context():
+        message = OutboxMessage.query.one()
+        assert (message.status, message.recipients, message.attempts) == ("pending", "author0@example.com", 0)
+        assert outbox.queue_depth() == 1
+
+
+def test_drain_sends_due_messages(app_context):
+    outbox.enqueue("Hello", ["a@example.com", "b@example.com"], "Body", sender="noreply@example.com")
+    flaskblog.db.session.commit()
+    sent_before, queued_before = outbox.stats.sent, _queued_count()
+    with flaskblog.mail.record_messages() as sent:
+        assert outbox.drain() == 1
+    assert [(mail.subject, mail.recipients) for mail in sent] == [("Hello", ["a@example.com", "b@example.com"])]
+    message = OutboxMessage.query.one()
+    assert message.status == "sent"
+    assert message.sent_at >= message.created_at
+    assert outbox.queue_depth() == 0
+    assert outbox.drain() == 0
+    assert outbox.stats.sent == sent_before + 1
+    # the enqueue to delivery delay ends up in the histogram
+    assert _queued_count() == queued_before + 1
+
+
+def test_refused_message_is_retried_with_backoff(app, app_context, monkeypatch):
+    _refuse(monkeypatch)
+    outbox.enqueue("Hello", ["nobody@example.com"], "Body", sender="noreply@example.com")
+    flaskblog.db.session.commit()
+    assert outbox.drain() == 1
+    message = OutboxMessage.query.one()
+    assert (message.status, message.attempts) == ("pending", 1)
+    assert "SMTPRecipientsRefused" in message.last_error
+    backoff = timedelta(seconds=app.config["MAIL_OUTBOX_BACKOFF"])
+    assert datetime.utcnow() + backoff - timedelta(seconds=5) < message.next_attempt_at <= datetime.utcnow() + backoff
+    assert outbox.drain() == 0  # not due yet
+
+    _make_due(message)
+    outbox.drain()
+    message = OutboxMessage.query.one()
+    # the delay doubles
+    assert message.next_attempt_at > datetime.utcnow() + 2 * backoff - timedelta(seconds=5)
+
+
+def test_message_is_dead_lettered_after_max_attempts(app, app_context, monkeypatch):
+    _refuse(monkeypatch)
+    outbox.enqueue("Hello", ["nobody@example.com"], "Body", sender="noreply@example.com")
+    flaskblog.db.session.commit()
+    dead_before = outbox.stats.dead
+    for _ in range(app.config["MAIL_OUTBOX_MAX_ATTEMPTS"]):
+        _make_due(OutboxMessage.query.one())
+        assert outbox.drain() == 1
+    message = OutboxMessage.query.one()
+    assert (message.status, message.attempts) == ("dead", app.config["MAIL_OUTBOX_MAX_ATTEMPTS"])
+    assert outbox.stats.dead == dead_before + 1
+    _make_due(message)
+    assert outbox.drain() == 0
+    assert outbox.queue_depth() == 0
+
+
+def test_lost_connection_fails_the_rest_of_the_batch(app_context, monkeypatch):
+    def send(connection, message, envelope_from=None):
+        raise ConnectionResetError("connection reset")
+    monkeypatch.setattr(flask_mail.Connection, "send", send)
+    for n in range(3):
+        outbox.enqueue(f"Hello {n}", ["a@example.com"], "Body", sender="noreply@example.com")
+    flaskblog.db.session.commit()
+    assert outbox.drain() == 3
+    assert [(message.status, message.attempts) for message in OutboxMessage.query] == [("pending", 1)] * 3
+
+
+def test_queue_delay_is_exported(app_context, client):
+    outbox.enqueue("Hello", ["a@example.com"], "Body", sender="noreply@example.com")
+    flaskblog.db.session.commit()
+    outbox.drain()
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE flaskblog_outbox_queued_seconds histogram" in body
+    assert 'flaskblog_outbox_queued_seconds_bucket{le="+Inf"}' in body
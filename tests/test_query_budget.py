@@ -0,0 +1,44 @@
+"""SQL statement budgets of the post listings (flaskblog.sqlstats.query_budget), enforced as in TestConfig.
+
+    python -m pytest tests
+"""
+import pytest
+
+import flaskblog
+import flaskblog.main.routes
+from flaskblog.models import Post
+from flaskblog.sqlstats import QueryBudgetExceeded
+
+
+def _cursor(body: str, name: str) -> str:
+    """Value of the first `name=` (after / before) cursor linked from a page."""
+    start = body.index(f"{name}=") + len(name) + 1
+    return body[start:body.index('"', start)]
+
+
+@pytest.mark.parametrize("path", ["/home", "/home?page=2", "/user/author1", "/user/author1?page=2"])
+def test_listings_stay_within_budget(client, path):
+    assert client.get(path).status_code == 200
+
+
+def test_cursor_pages_stay_within_budget(client):
+    for path in ["/home", "/user/author2"]:
+        older = client.get(f"{path}?after={_cursor(client.get(path).get_data(as_text=True), 'after')}")
+        assert older.status_code == 200
+        # and back to the newer posts
+        newer = client.get(f"{path}?before={_cursor(older.get_data(as_text=True), 'before')}")
+        assert newer.status_code == 200
+
+
+def test_listings_stay_within_budget_logged_in(client, login):
+    login("author0")
+    for path in ["/home", "/home?page=2", "/user/author3"]:
+        assert client.get(path).status_code == 200
+
+
+def test_lazy_loaded_listing_goes_over_budget(client, monkeypatch):
+    # the listing as it was before authors were joined in: one more SELECT per author on the page
+    monkeypatch.setattr(flaskblog.main.routes, "_post_listing",
+                        lambda: Post.query.options(flaskblog.db.lazyload(Post.author)))
+    with pytest.raises(QueryBudgetExceeded):
+        client.get("/home")
@@ -0,0 +1,78 @@
+"""Token bucket rate limits of the login form (flaskblog.ratelimit), in process and on the shared backend."""
+import time
+
+import pytest
+
+import flaskblog.ratelimit
+from conftest import BlogTestConfig
+
+# two logins per address a minute, three per account over five minutes
+LIMITS = {"users.login": {"ip": (2, 60), "account": (3, 300)}}
+
+
+class LimitedConfig(BlogTestConfig):
+    RATELIMIT_ENABLED = True
+    RATELIMIT_ROUTES = LIMITS
+
+
+class SharedLimitedConfig(LimitedConfig):
+    RATELIMIT_BACKEND = "shared"  # without CACHE_SHARED_URL: the in-process stand-in of the server
+
+
+@pytest.fixture(params=[LimitedConfig, SharedLimitedConfig], ids=["memory", "shared"])
+def app_config(request):
+    return request.param
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Moves the clock of the buckets forward by the given seconds."""
+    offset = [0.0]
+    monotonic = time.monotonic
+    monkeypatch.setattr(flaskblog.ratelimit.time, "monotonic", lambda: monotonic() + offset[0])
+
+    def advance(seconds: float):
+        offset[0] += seconds
+    return advance
+
+
+def _login(client, email: str = "author0@example.com", address: str = "10.0.0.1"):
+    return client.post("/login", data={"email": email, "password": "wrong"}, environ_base={"REMOTE_ADDR": address})
+
+
+def test_drained_bucket_gets_429_with_retry_after(client):
+    for n in range(2):
+        assert _login(client, email=f"user{n}@example.com").status_code == 200  # the form again, with the error
+    response = _login(client, email="user2@example.com")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
+    # other addresses have their own bucket
+    assert _login(client, email="user3@example.com", address="10.0.0.2").status_code == 200
+
+
+def test_bucket_refills(client, clock):
+    for n in range(2):
+        _login(client, email=f"user{n}@example.com")
+    assert _login(client, email="user2@example.com").status_code == 429
+    clock(31)  # one token back
+    assert _login(client, email="user3@example.com").status_code == 200
+    assert _login(client, email="user4@example.com").status_code == 429
+
+
+def test_account_limit_holds_across_addresses(client):
+    for n in range(3):
+        assert _login(client, address=f"10.0.1.{n}").status_code == 200
+    assert _login(client, address="10.0.1.9").status_code == 429
+    assert _login(client, email="author1@example.com", address="10.0.1.9").status_code == 200
+
+
+def test_only_posts_are_limited(client):
+    for _ in range(5):
+        assert client.get("/login", environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code == 200
+
+
+def test_throttled_requests_are_counted(client):
+    before = flaskblog.ratelimit.stats.snapshot().get(("users.login", "ip"), 0)
+    for n in range(3):
+        _login(client, email=f"user{n}@example.com")
+    assert flaskblog.ratelimit.stats.snapshot()[("users.login", "ip")] == before + 1
@@ -0,0 +1,71 @@
+"""Rendering and sanitizing of post sources (flaskblog.posts.rendering)."""
+import sys
+
+import pytest
+
+from flaskblog.posts.rendering import _check_markup, _render
+
+HOSTILE = [
+    "<script>alert(1)</script>",
+    '<img src="x.png" onerror="alert(1)">',
+    "[click](javascript:alert(1))",
+    '<a href="javascript:alert(1)">click</a>',
+    '<div style="position:fixed">raw <b onclick="alert(1)">html</b></div>',
+]
+
+
+def _html(content: str, markup: str) -> str:
+    return _render(content, markup, 300)["content_html"]
+
+
+@pytest.mark.parametrize("content", HOSTILE)
+def test_plain_escapes_every_tag(content):
+    rendered = _html(content, "plain")
+    assert rendered.startswith("<p>") and rendered.endswith("</p>")
+    assert "<" not in rendered[len("<p>"):-len("</p>")]
+
+
+def test_plain_keeps_paragraphs_and_line_breaks():
+    assert _html("one\r\ntwo\n\n\nthree", "plain") == "<p>one<br>\ntwo</p>\n<p>three</p>"
+
+
+def test_summary_is_of_the_text_not_the_source():
+    fields = _render("<b>bold</b> move", "plain", 300)
+    assert fields["excerpt"] == "<b>bold</b> move"
+    assert fields["word_count"] == 2
+    assert fields["renderer_version"] == "plain-1"
+
+
+@pytest.mark.parametrize("content, unwanted", [
+    ("<script>alert(1)</script>", "<script"),
+    ('<img src="x.png" onerror="alert(1)">', "onerror"),
+    ("[click](javascript:alert(1))", "javascript:"),
+    ('<a href="javascript:alert(1)">click</a>', "javascript:"),
+    ('<div style="position:fixed">raw <b onclick="alert(1)">html</b></div>', "<div"),
+    ('<div style="position:fixed">raw <b onclick="alert(1)">html</b></div>', "onclick"),
+])
+def test_markdown_strips_what_isnt_allowed(content, unwanted):
+    pytest.importorskip("bleach")
+    pytest.importorskip("markdown")
+    assert unwanted not in _html(content, "markdown")
+
+
+def test_markdown_keeps_allowed_markup():
+    pytest.importorskip("bleach")
+    pytest.importorskip("markdown")
+    rendered = _html("**bold** [link](https://example.com)\n\n```python\nx = 1\n```", "markdown")
+    assert "<strong>bold</strong>" in rendered
+    assert 'href="https://example.com"' in rendered and 'rel="nofollow"' in rendered
+    assert '<code class="language-python">' in rendered
+
+
+def test_unknown_markup_fails_at_startup():
+    with pytest.raises(ValueError):
+        _check_markup("rst")
+
+
+def test_markdown_without_its_packages_fails_at_startup(monkeypatch):
+    monkeypatch.setitem(sys.modules, "bleach", None)  # what an uninstalled package imports as
+    with pytest.raises(RuntimeError, match="POST_MARKUP"):
+        _check_markup("markdown")
+    _check_markup("plain")
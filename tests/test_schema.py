@@ -0,0 +1,82 @@
+"""`flask db upgrade` (flaskblog.schema) on a database created by the first version of the app."""
+import sqlite3
+
+import pytest
+
+import flaskblog
+from flaskblog.config import TestConfig
+
+# the schema site.db was created with, before any column, table or index was added
+BASELINE_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL, username VARCHAR(20) NOT NULL, email VARCHAR(120) NOT NULL,
+    image_file VARCHAR(20) NOT NULL, password VARCHAR(60) NOT NULL,
+    PRIMARY KEY (id), UNIQUE (username), UNIQUE (email)
+);
+CREATE TABLE post (
+    id INTEGER NOT NULL, title VARCHAR(100) NOT NULL, date_posted DATETIME NOT NULL, content TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id)
+);
+INSERT INTO user VALUES (1, 'old', 'old@example.com', 'default.jpg', 'x');
+INSERT INTO post VALUES (1, 'First', '2021-11-20 14:40:27.000000', 'Hello <b>world</b>', 1);
+INSERT INTO post VALUES (2, 'Second', '2021-11-21 09:18:46.000000', 'Searchable words here', 1);
+"""
+
+
+@pytest.fixture
+def old_app(tmp_path):
+    path = tmp_path / "site.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+
+    class OldDatabaseConfig(TestConfig):
+        CACHE_TYPE = "null"
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+
+    app = flaskblog.create_app(OldDatabaseConfig)
+    yield app
+    with app.app_context():
+        flaskblog.db.session.remove()
+        flaskblog.db.engine.dispose()
+
+
+def test_upgrade_brings_old_database_up_to_date(old_app):
+    runner = old_app.test_cli_runner()
+    result = runner.invoke(args=["db", "upgrade", "--batch-size", "1"])
+    assert result.exit_code == 0, result.output
+    assert "Added column post.content_html." in result.output
+    assert "Built the search index." in result.output
+
+    with old_app.app_context():
+        rows = flaskblog.db.session.execute(
+            "SELECT date_posted <= date_modified, content_html, excerpt, word_count FROM post ORDER BY id").all()
+        assert rows[0] == (1, "<p>Hello &lt;b&gt;world&lt;/b&gt;</p>", "Hello <b>world</b>", 2)
+        assert all(row[1] is not None for row in rows)
+        assert flaskblog.db.session.execute("SELECT value FROM counter WHERE name = 'posts'").scalar() == 2
+        assert flaskblog.db.session.execute("SELECT post_count FROM user").scalar() == 2
+
+    client = old_app.test_client()
+    assert b"Second" in client.get("/search?q=searchable").data
+    assert client.get("/home").status_code == 200
+    assert client.get("/post/1").status_code == 200
+
+    # and nothing left to do the second time
+    result = runner.invoke(args=["db", "upgrade"])
+    assert result.output == "The database was already up to date.\n"
+
+
+def test_upgrade_restores_missing_search_triggers(old_app):
+    runner = old_app.test_cli_runner()
+    runner.invoke(args=["db", "upgrade"])
+    with old_app.app_context():
+        flaskblog.db.session.execute("DROP TRIGGER post_fts_ai")
+        flaskblog.db.session.commit()
+    runner.invoke(args=["db", "upgrade"])
+    with old_app.app_context():
+        flaskblog.db.session.execute(
+            "INSERT INTO post (title, date_posted, date_modified, content, user_id, word_count) "
+            "VALUES ('Third', '2021-11-22 10:00:00.000000', '2021-11-22 10:00:00.000000', 'freshly indexed', 1, 2)")
+        flaskblog.db.session.commit()
+    assert b"Third" in old_app.test_client().get("/search?q=freshly").data